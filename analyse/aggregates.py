@@ -0,0 +1,438 @@
+# per-day partial aggregates of the matches and champs data, merged over any window of days
+
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from itertools import repeat
+
+import numpy as np
+import pandas as pd
+
+from histograms import Histograms
+from matchups import Matchups
+from loader import TIERS, data_directory, cache_directory, get_daily_files, load_file, iter_typed_file, matches_dtypes, champs_dtypes, tier_dtype, WORKERS, CHUNK_SIZE
+
+# bump when the content of the partials changes, so that the stored ones are computed again
+AGGREGATES_VERSION = 4
+aggregates_directory = os.path.join(cache_directory, "aggregates")
+
+matches_keys = ["tier", "gameVersion"]
+# teamPosition is "" for the bans, championId is -1 for the missed bans
+champs_keys = ["tier", "teamPosition", "championId", "gameVersion"]
+matchups_keys = ["tier", "teamPosition", "championId", "opponentId"]
+
+# the objectives of a match, summed over the two teams
+objectives = {
+    "total_barons": ("100_nbBarons", "200_nbBarons"),
+    "total_dragons": ("100_nbDragons", "200_nbDragons"),
+    "total_towers": ("100_nbTowers", "200_nbTowers"),
+    "total_heralds": ("100_nbRiftHeralds", "200_nbRiftHeralds"),
+    "total_kills": ("100_nbKills", "200_nbKills"),
+}
+
+
+def get_day(path):
+    """
+    It returns the day of a daily file, e.g. matches_data_euw1_20220601.csv or matches_data_20220601.parquet
+
+    :param path: the path of the file
+    :return: A datetime
+    """
+    return datetime.strptime(re.search(r"(\d{8})\.(?:csv|parquet)$", path).group(1), "%Y%m%d")
+
+def with_squares(values, columns):
+    # the sums of squares give the variance of the merged groups
+    for column in columns:
+        values[column + "_sq"] = values[column] * values[column]
+    return values
+
+def compute_matches_partial(matches_df):
+    """
+    It aggregates the matches of one file by tier and patch: the number of matches, the wins of each
+    side, and the sums and sums of squares of the game duration and of the objectives. Matches with
+    missing values are left out, as in rank_different.py
+
+    :param matches_df: the typed matches data of a file (see loader.load_matches)
+    :return: A dataframe with the columns matches_keys and the summed columns
+    """
+    matches_df = matches_df.dropna()
+
+    values = pd.DataFrame({
+        "tier": matches_df["tier"].astype(object),
+        "gameVersion": matches_df["gameVersion"].astype(object),
+        "count": np.ones(len(matches_df), dtype=np.int64),
+        "100_win": matches_df["100_win"].astype("int64"),
+        "200_win": matches_df["200_win"].astype("int64"),
+        "gameDuration": matches_df["gameDuration"].astype("int64"),
+    })
+    for total, (blue_column, red_column) in objectives.items():
+        values[total] = matches_df[blue_column].astype("int64") + matches_df[red_column].astype("int64")
+    values = with_squares(values, ["gameDuration"] + list(objectives))
+
+    return values.groupby(matches_keys, sort=False).sum().reset_index()
+
+def get_durations_histograms(matches_df):
+    # matches with missing values are left out, like in compute_matches_partial
+    matches_df = matches_df.dropna()
+    return Histograms(TIERS).update(matches_df["tier"], matches_df["gameDuration"])
+
+def get_matchups_partial(champs_df):
+    """
+    It counts the lane matchups of the champs rows of one file: the games and wins of each champion
+    against its lane opponent, by tier and position. The bans and the rows of files written before
+    opponentId have no opponent, they are left out
+
+    :param champs_df: the typed champs data of a file (see loader.load_champs)
+    :return: A dataframe with the columns matchups_keys, games and wins (see Matchups.to_frame)
+    """
+    champion_ids = pd.concat([champs_df["championId"], champs_df["opponentId"]]).dropna().unique()
+    matchups = Matchups(champion_ids).update(
+        champs_df["tier"], champs_df["teamPosition"], champs_df["championId"], champs_df["opponentId"], champs_df["win"]
+    )
+    return matchups.to_frame()
+
+def compute_champs_partial(champs_df, matches_df):
+    """
+    It aggregates the champs rows of one file by tier, position, champion and patch: the number of
+    rows, the wins, picks and bans, and the sums and sums of squares of kills, deaths and assists.
+    Bans are kept, with an empty position
+
+    :param champs_df: the typed champs data of a file (see loader.load_champs)
+    :param matches_df: the typed matches data of the same file, for the patch of each match
+    :return: A dataframe with the columns champs_keys and the summed columns
+    """
+    game_versions = matches_df.drop_duplicates("matchId").set_index("matchId")["gameVersion"].astype(object)
+
+    values = pd.DataFrame({
+        "tier": champs_df["tier"].astype(object),
+        "teamPosition": champs_df["teamPosition"].astype(object).fillna(""),
+        "championId": champs_df["championId"].fillna(-1).astype("int64"),
+        "gameVersion": champs_df["matchId"].map(game_versions).fillna(""),
+        "count": np.ones(len(champs_df), dtype=np.int64),
+        "win": champs_df["win"].fillna(False).astype("int64"),
+        "pick": champs_df["pick"].fillna(False).astype("int64"),
+        "ban": champs_df["ban"].fillna(False).astype("int64"),
+    })
+    # for ban champions, assists, deaths, kills is Null
+    for column in ["kills", "deaths", "assists"]:
+        values[column] = champs_df[column].fillna(0).astype("int64")
+    values = with_squares(values, ["kills", "deaths", "assists"])
+
+    values = values[values["tier"].notna()]
+    return values.groupby(champs_keys, sort=False).sum().reset_index()
+
+def sum_partials(partials, keys):
+    """
+    It reduces partial aggregates of the same keys, e.g. those of the chunks of a file, into one
+
+    :param partials: a list of partial aggregates
+    :param keys: the key columns, matches_keys or champs_keys
+    :return: A dataframe with one row per key
+    """
+    return pd.concat(partials, ignore_index=True).groupby(keys, sort=False).sum().reset_index()
+
+def compute_day_partials(matches_path, champs_path, chunk_size):
+    """
+    It computes the partial aggregates of the files of a day one chunk at a time: only a chunk of rows,
+    the patch of each match of the day and the partials of the chunks are in memory
+
+    :param matches_path: the matches data file of the day
+    :param champs_path: the champs data file of the same day
+    :param chunk_size: the number of bytes of a file parsed at a time
+    :return: A tuple (matches partial, champs partial, durations partial, matchups partial)
+    """
+    matches_partials, game_versions = [], []
+    durations = Histograms(TIERS)
+    for matches_df in iter_typed_file(matches_path, matches_dtypes, chunk_size):
+        matches_partials.append(compute_matches_partial(matches_df))
+        durations.merge(get_durations_histograms(matches_df))
+        game_versions.append(matches_df[["matchId", "gameVersion"]].astype(object))
+    game_versions = pd.concat(game_versions, ignore_index=True)
+
+    champs_partials, matchups_partials = [], []
+    for champs_df in iter_typed_file(champs_path, champs_dtypes, chunk_size):
+        champs_partials.append(compute_champs_partial(champs_df, game_versions))
+        matchups_partials.append(get_matchups_partial(champs_df))
+
+    return (sum_partials(matches_partials, matches_keys), sum_partials(champs_partials, champs_keys), durations.to_frame(),
+            sum_partials(matchups_partials, matchups_keys))
+
+def get_partials_key(matches_path, champs_path):
+    key = {'version': AGGREGATES_VERSION}
+    for name, path in [('matches', matches_path), ('champs', champs_path)]:
+        stat = os.stat(path)
+        key[name] = [os.path.basename(path), stat.st_size, stat.st_mtime_ns]
+    return key
+
+def load_day_partials(matches_path, champs_path, aggregates_directory=aggregates_directory, chunk_size=None):
+    """
+    It returns the partial aggregates of the files of a day, from the stored ones if the files did not
+    change, otherwise computed from the files and stored
+
+    :param matches_path: the matches data file of the day
+    :param champs_path: the champs data file of the same day
+    :param aggregates_directory: the directory of the stored partials
+    :param chunk_size: None to compute the partials from the whole typed files (see loader.load_file),
+    otherwise the number of bytes of a file parsed at a time
+    :return: A tuple (matches partial, champs partial, durations partial, matchups partial), the
+    durations partial is the histograms of the game duration by tier (see Histograms.to_frame), the
+    matchups partial the lane matchups of the day (see Matchups.to_frame)
+    """
+    label = get_label(matches_path, "matches_data")
+    partial_paths = [os.path.join(aggregates_directory, "{}_{}.parquet".format(name, label)) for name in ["matches", "champs", "durations", "matchups"]]
+    key_path = os.path.join(aggregates_directory, "{}.json".format(label))
+    key = get_partials_key(matches_path, champs_path)
+
+    if all(os.path.exists(path) for path in partial_paths + [key_path]):
+        with open(key_path, "r") as f:
+            if json.load(f) == key:
+                return tuple(pd.read_parquet(path) for path in partial_paths)
+
+    if chunk_size is None:
+        matches_df = load_file(matches_path, matches_dtypes)
+        champs_df = load_file(champs_path, champs_dtypes)
+        partials = (compute_matches_partial(matches_df), compute_champs_partial(champs_df, matches_df),
+                    get_durations_histograms(matches_df).to_frame(), get_matchups_partial(champs_df))
+    else:
+        partials = compute_day_partials(matches_path, champs_path, chunk_size)
+
+    os.makedirs(aggregates_directory, exist_ok=True)
+    for partial, path in zip(partials, partial_paths):
+        partial.to_parquet(path, index=False)
+    # the key is written last: partials without their key are never read
+    with open(key_path, "w") as f:
+        json.dump(key, f)
+
+    return partials
+
+def get_label(path, name):
+    # the day (and region) of a daily file, whatever its format
+    return os.path.splitext(os.path.basename(path))[0][len(name) + 1:]
+
+def get_daily_file_pairs(directory=data_directory):
+    """
+    It returns the matches and champs data files of each day that has both
+
+    :param directory: the directory of the daily files
+    :return: A list of tuples (matches path, champs path), sorted by file name
+    """
+    champs_files = {get_label(path, "champs_data"): path for path in get_daily_files(directory, "champs_data")}
+    return [
+        (matches_path, champs_files[get_label(matches_path, "matches_data")])
+        for matches_path in sorted(get_daily_files(directory, "matches_data"))
+        if get_label(matches_path, "matches_data") in champs_files
+    ]
+
+def add_day(partial, day):
+    partial = partial.copy()
+    partial.insert(0, "day", day)
+    return partial
+
+def load_daily_partials(directory=data_directory, aggregates_directory=aggregates_directory, workers=WORKERS,
+                        processes=None, chunk_size=None):
+    """
+    It returns the partial aggregates of every day. Only the days whose files changed since the last
+    call are computed, the others are read from the aggregates directory.
+
+    With `processes`, the days are mapped to a pool of processes, which use all the cores, and the
+    get_* functions reduce their partials. Each process reads its files by chunks of `chunk_size`
+    bytes, so the memory used depends on the chunk size and the number of processes, not on the
+    number of days
+
+    :param directory: the directory of the daily files
+    :param aggregates_directory: the directory of the stored partials
+    :param workers: the number of days computed at the same time by threads, without `processes`
+    :param processes: the number of processes, None to compute the days in threads of this process
+    :param chunk_size: the number of bytes of a file parsed at a time, defaults to loader.CHUNK_SIZE
+    with `processes`. None without `processes` computes from the whole typed files
+    :return: A tuple (matches partials, champs partials, durations partials, matchups partials), with a
+    "day" column
+    """
+    file_pairs = get_daily_file_pairs(directory)
+    if not file_pairs:
+        raise ValueError("No daily files in {}".format(directory))
+
+    if processes:
+        executor = ProcessPoolExecutor(max_workers=processes)
+        chunk_size = chunk_size or CHUNK_SIZE
+    else:
+        executor = ThreadPoolExecutor(max_workers=workers)
+
+    matches_paths, champs_paths = zip(*file_pairs)
+    with executor:
+        day_partials = list(executor.map(load_day_partials, matches_paths, champs_paths,
+                                         repeat(aggregates_directory), repeat(chunk_size)))
+
+    days = [get_day(matches_path) for matches_path, _ in file_pairs]
+    return tuple(
+        pd.concat([add_day(partials[i], day) for day, partials in zip(days, day_partials)], ignore_index=True)
+        for i in range(4)
+    )
+
+def get_last_days(partials, nb_days, end=None):
+    """
+    It returns the window of the last days of the data, e.g. the last 7 or 30 days
+
+    :param partials: partial aggregates, with a "day" column
+    :param nb_days: the number of days of the window
+    :param end: the last day of the window, defaults to the last day of the data
+    :return: A tuple (start, end), to give to the get_* functions
+    """
+    end = end or partials["day"].max()
+    return end - timedelta(days=nb_days - 1), end
+
+def select_days(partials, start=None, end=None):
+    if start is not None:
+        partials = partials[partials["day"] >= start]
+    if end is not None:
+        partials = partials[partials["day"] <= end]
+    return partials
+
+def get_champion_name(champion_id, champion_names):
+    # champions missing from the dimension files keep their id
+    return champion_names.get(champion_id, str(champion_id))
+
+def as_categories(partials, columns, champion_names=None):
+    """
+    It types the keys of merged partials like the loaded data: tier with its order, championId with
+    the order of the champion names, the other keys with their sorted values, so that groupby gives the
+    groups of the in-memory analysis
+    """
+    partials = partials.copy()
+    for column in columns:
+        if column == "tier":
+            partials[column] = partials[column].astype(tier_dtype)
+        elif column == "championId":
+            values = partials[column][partials[column] >= 0].unique()
+            categories = sorted(values, key=lambda champion_id: get_champion_name(champion_id, champion_names or {}))
+            partials[column] = pd.Categorical(partials[column], categories=categories)
+        else:
+            values = partials[column][partials[column] != ""]
+            partials[column] = pd.Categorical(partials[column], categories=sorted(values.unique()))
+    return partials
+
+def get_mean(sums, column):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return sums[column] / sums["count"]
+
+def get_std(sums, column):
+    # population standard deviation, from the sums and sums of squares
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = sums[column] / sums["count"]
+        return np.sqrt(np.maximum(sums[column + "_sq"] / sums["count"] - mean * mean, 0))
+
+def add_champion_names(frame, champion_names):
+    # the names are added to the merged rows, the groups use the ids
+    names = [get_champion_name(champion_id, champion_names or {}) for champion_id in frame["championId"].cat.categories]
+    position = frame.columns.get_loc("championId") + 1
+    frame.insert(position, "championName", pd.Categorical.from_codes(frame["championId"].cat.codes, categories=names))
+    return frame
+
+def get_champion_stats(champs_partials, start=None, end=None, with_std=False, champion_names=None):
+    """
+    It returns the stats of each tier, position and champion over a window of days, the champs_stats
+    table of rank_different.py. Its cost depends on the number of partial rows of the window, not on
+    the number of matches
+
+    :param champs_partials: the champs partials of load_daily_partials
+    :param start: the first day of the window, None for the first day of the data
+    :param end: the last day of the window, None for the last day of the data
+    :param with_std: True to add the standard deviations of kills, deaths and assists
+    :param champion_names: the names of the champions, see loader.load_champion_names
+    :return: A dataframe with the columns tier, teamPosition, championId, championName, matchId (the
+    number of rows), win, assists, deaths, kills and pick
+    """
+    partials = as_categories(select_days(champs_partials, start, end), ["tier", "teamPosition", "championId"], champion_names)
+    # bans have no position
+    partials = partials[partials["teamPosition"].notna()]
+    sums = partials.groupby(["tier", "teamPosition", "championId"], observed=False).sum(numeric_only=True).reset_index()
+
+    stats = add_champion_names(sums[["tier", "teamPosition", "championId"]].copy(), champion_names)
+    stats["matchId"] = sums["count"]
+    stats["win"] = sums["win"]
+    for column in ["assists", "deaths", "kills"]:
+        stats[column] = get_mean(sums, column)
+    stats["pick"] = sums["pick"]
+    if with_std:
+        for column in ["assists", "deaths", "kills"]:
+            stats[column + "_std"] = get_std(sums, column)
+    return stats
+
+def get_most_banned(champs_partials, start=None, end=None, champion_names=None):
+    """
+    It returns the number of bans of each tier and champion over a window of days
+
+    :param champs_partials: the champs partials of load_daily_partials
+    :param start: the first day of the window, None for the first day of the data
+    :param end: the last day of the window, None for the last day of the data
+    :param champion_names: the names of the champions, see loader.load_champion_names
+    :return: A dataframe with the columns tier, championId, championName and ban
+    """
+    partials = as_categories(select_days(champs_partials, start, end), ["tier", "championId"], champion_names)
+    bans = partials.groupby(["tier", "championId"], observed=False)[["ban"]].sum().reset_index()
+    return add_champion_names(bans, champion_names)
+
+def get_winrate_by_rank(matches_partials, start=None, end=None):
+    """
+    It returns the wins of each side by tier over a window of days
+
+    :param matches_partials: the matches partials of load_daily_partials
+    :param start: the first day of the window, None for the first day of the data
+    :param end: the last day of the window, None for the last day of the data
+    :return: A dataframe with the columns tier, 100_win, 200_win and matchId (the number of matches)
+    """
+    partials = as_categories(select_days(matches_partials, start, end), ["tier"])
+    sums = partials.groupby(["tier"], observed=False)[["100_win", "200_win", "count"]].sum().reset_index()
+    return sums.rename(columns={"count": "matchId"})
+
+def get_objectives_by_rank(matches_partials, start=None, end=None, with_std=False):
+    """
+    It returns the average objectives per game of each tier over a window of days
+
+    :param matches_partials: the matches partials of load_daily_partials
+    :param start: the first day of the window, None for the first day of the data
+    :param end: the last day of the window, None for the last day of the data
+    :param with_std: True to add the standard deviations
+    :return: A dataframe with the columns tier, total_barons, total_dragons, total_towers, total_heralds
+    and total_kills
+    """
+    partials = as_categories(select_days(matches_partials, start, end), ["tier"])
+    sums = partials.groupby(["tier"], observed=False).sum(numeric_only=True).reset_index()
+
+    stats = sums[["tier"]].copy()
+    for total in objectives:
+        stats[total] = get_mean(sums, total)
+    if with_std:
+        for total in objectives:
+            stats[total + "_std"] = get_std(sums, total)
+    return stats
+
+def get_duration_by_rank(durations_partials, start=None, end=None):
+    """
+    It returns the histograms of the game duration of each tier over a window of days, merged from
+    the histograms of the days: its size depends on the number of tiers and bins, not on the number
+    of matches
+
+    :param durations_partials: the durations partials of load_daily_partials
+    :param start: the first day of the window, None for the first day of the data
+    :param end: the last day of the window, None for the last day of the data
+    :return: Histograms, e.g. get_duration_by_rank(durations_partials).get_box_stats()
+    """
+    return Histograms(TIERS).add_frame(select_days(durations_partials, start, end))
+
+def get_matchups(matchups_partials, start=None, end=None):
+    """
+    It returns the lane matchups of each tier and position over a window of days, merged from the
+    matchups of the days into dense count arrays: their size depends on the number of champions, not
+    on the number of matches
+
+    :param matchups_partials: the matchups partials of load_daily_partials
+    :param start: the first day of the window, None for the first day of the data
+    :param end: the last day of the window, None for the last day of the data
+    :return: Matchups, e.g. get_matchups(matchups_partials).get_counters(champion_id, 'DIAMOND', 'MIDDLE')
+    """
+    partials = select_days(matchups_partials, start, end)
+    champion_ids = np.union1d(partials["championId"].to_numpy(), partials["opponentId"].to_numpy())
+    return Matchups(champion_ids).add_frame(partials)
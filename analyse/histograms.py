@@ -0,0 +1,157 @@
+# fixed-bin histograms of a value by group (e.g. the game duration by tier): mergeable, and enough for
+# the quantiles and box plot statistics without keeping the values
+
+import numpy as np
+import pandas as pd
+
+# game durations, in seconds, are counted by bins of 10 seconds up to 3 hours. Longer games are
+# counted in the last bin
+DURATION_BIN_WIDTH = 10
+MAX_DURATION = 3 * 60 * 60
+
+
+class Histograms:
+    """
+    One histogram per group, with the same bins: the bin of a value is value // bin_width, values
+    below 0 go to the first bin and values from max_value to the last one. The minimum and maximum of
+    each group are kept exactly. Histograms of the same groups and bins are merged by adding their
+    counts, so they can be built per day, per chunk or per process and combined in any order.
+    Quantiles are interpolated inside a bin, their error is below bin_width
+    """
+
+    def __init__(self, groups, bin_width=DURATION_BIN_WIDTH, max_value=MAX_DURATION):
+        self.groups = list(groups)
+        self.bin_width = bin_width
+        self.nb_bins = max_value // bin_width + 1
+        self.counts = np.zeros((len(self.groups), self.nb_bins), dtype=np.int64)
+        self.minimum = np.full(len(self.groups), np.inf)
+        self.maximum = np.full(len(self.groups), -np.inf)
+
+    def get_group_codes(self, groups):
+        return pd.Categorical(np.asarray(groups, dtype=object), categories=self.groups).codes.astype(np.int64)
+
+    def update(self, groups, values):
+        """
+        It counts values, e.g. those of a chunk of rows. Values whose group is not one of the
+        histograms, or that are missing, are left out
+
+        :param groups: the group of each value, e.g. the tier column
+        :param values: the values, e.g. the gameDuration column
+        :return: The histograms
+        """
+        codes = self.get_group_codes(groups)
+        values = pd.to_numeric(pd.Series(values), errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+        keep = (codes >= 0) & ~np.isnan(values)
+        codes, values = codes[keep], values[keep]
+
+        bins = np.clip(values // self.bin_width, 0, self.nb_bins - 1).astype(np.int64)
+        self.counts += np.bincount(codes * self.nb_bins + bins, minlength=self.counts.size).reshape(self.counts.shape)
+        np.minimum.at(self.minimum, codes, values)
+        np.maximum.at(self.maximum, codes, values)
+        return self
+
+    def merge(self, other):
+        """
+        It adds the counts of other histograms of the same groups and bins
+
+        :param other: Histograms
+        :return: The histograms
+        """
+        if self.groups != other.groups or self.bin_width != other.bin_width or self.nb_bins != other.nb_bins:
+            raise ValueError("Histograms with different groups or bins cannot be merged")
+
+        self.counts += other.counts
+        self.minimum = np.minimum(self.minimum, other.minimum)
+        self.maximum = np.maximum(self.maximum, other.maximum)
+        return self
+
+    def to_frame(self):
+        """
+        It returns the non-empty bins, to store the histograms
+
+        :return: A dataframe with the columns group, bin, count, minimum and maximum (those of the group)
+        """
+        codes, bins = np.nonzero(self.counts)
+        return pd.DataFrame({
+            "group": np.asarray(self.groups, dtype=object)[codes],
+            "bin": bins,
+            "count": self.counts[codes, bins],
+            "minimum": self.minimum[codes],
+            "maximum": self.maximum[codes],
+        })
+
+    def add_frame(self, frame):
+        """
+        It adds bins returned by to_frame, of one or several histograms of the same bins
+
+        :param frame: a dataframe with the columns of to_frame
+        :return: The histograms
+        """
+        codes = self.get_group_codes(frame["group"])
+        keep = codes >= 0
+        codes = codes[keep]
+
+        np.add.at(self.counts, (codes, frame["bin"].to_numpy()[keep]), frame["count"].to_numpy()[keep])
+        np.minimum.at(self.minimum, codes, frame["minimum"].to_numpy(dtype=np.float64)[keep])
+        np.maximum.at(self.maximum, codes, frame["maximum"].to_numpy(dtype=np.float64)[keep])
+        return self
+
+    def get_quantiles(self, quantiles):
+        """
+        It returns quantiles of each group, interpolated linearly inside their bin and bounded by the
+        minimum and maximum of the group
+
+        :param quantiles: a list of quantiles between 0 and 1, e.g. [0.25, 0.5, 0.75]
+        :return: A numpy array of shape (groups, quantiles), NaN for an empty group
+        """
+        quantiles = np.asarray(quantiles, dtype=np.float64)
+        totals = self.counts.sum(axis=1)
+        cumulated = np.cumsum(self.counts, axis=1)
+
+        result = np.full((len(self.groups), len(quantiles)), np.nan)
+        for code in np.nonzero(totals)[0]:
+            ranks = quantiles * totals[code]
+            bins = np.minimum(np.searchsorted(cumulated[code], ranks, side="left"), self.nb_bins - 1)
+            before = cumulated[code][bins] - self.counts[code][bins]
+            # the values of a bin are assumed spread evenly over it
+            with np.errstate(divide="ignore", invalid="ignore"):
+                fraction = np.where(self.counts[code][bins] > 0, (ranks - before) / self.counts[code][bins], 0)
+            values = (bins + fraction) * self.bin_width
+            result[code] = np.clip(values, self.minimum[code], self.maximum[code])
+        return result
+
+    def get_box_stats(self, whis=1.5):
+        """
+        It returns the statistics of a box plot of each group: the quartiles, and the whiskers at the
+        furthest bin within `whis` times the interquartile range of the quartiles. Their format is the
+        one of matplotlib's Axes.bxp, e.g. plt.gca().bxp(histograms.get_box_stats(), showfliers=False)
+
+        :param whis: the length of the whiskers, in interquartile ranges
+        :return: A list with a dictionary per non-empty group: label, count, q1, med, q3, whislo,
+        whishi, min, max and nb_fliers (the number of values beyond the whiskers, to the resolution of
+        a bin)
+        """
+        quartiles = self.get_quantiles([0.25, 0.5, 0.75])
+        edges = np.arange(self.nb_bins) * self.bin_width
+
+        box_stats = []
+        for code, group in enumerate(self.groups):
+            count = int(self.counts[code].sum())
+            if count == 0:
+                continue
+            q1, med, q3 = quartiles[code]
+            low, high = q1 - whis * (q3 - q1), q3 + whis * (q3 - q1)
+
+            nonempty = self.counts[code] > 0
+            # the whiskers end at the last bins that have values within the limits
+            inside = nonempty & (edges + self.bin_width > low) & (edges <= high)
+            whislo = max(edges[inside].min(), low, self.minimum[code]) if inside.any() else q1
+            whishi = min(edges[inside].max() + self.bin_width, high, self.maximum[code]) if inside.any() else q3
+            nb_fliers = int(self.counts[code][nonempty & ~inside].sum())
+
+            box_stats.append({
+                "label": group, "count": count, "q1": q1, "med": med, "q3": q3,
+                "whislo": whislo, "whishi": whishi, "min": self.minimum[code], "max": self.maximum[code],
+                "nb_fliers": nb_fliers, "fliers": [],
+            })
+        return box_stats
@@ -0,0 +1,365 @@
+# typed loading of the daily matches and champs files: the parquet files of the ingestion when it wrote them,
+# otherwise the CSV files, with a parquet cache per file
+
+import glob
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+from pandas.api.types import union_categoricals
+
+data_directory = os.path.join(os.path.dirname(__file__), "..", "ingestion", "data")
+cache_directory = os.path.join(data_directory, "analysis_cache")
+
+# number of files parsed at the same time
+WORKERS = min(8, os.cpu_count() or 1)
+# number of bytes of a file parsed at a time by iter_typed_file
+CHUNK_SIZE = 16 * 1024 * 1024
+
+TIERS = ["IRON", "BRONZE", "SILVER", "GOLD", "PLATINUM", "DIAMOND"]
+tier_dtype = pd.CategoricalDtype(categories=TIERS, ordered=True)
+
+# columns read by the analysis and their types. Nullable types are used where a file can have
+# empty values, the analysis decides how to fill or drop them
+matches_dtypes = {
+    "matchId": "object",
+    "tier": tier_dtype,
+    "gameDuration": "Int32",
+    "gameVersion": "category",
+    "100_firstBaron": "boolean",
+    "100_nbBarons": "Int8",
+    "100_firstKill": "boolean",
+    "100_nbKills": "Int16",
+    "100_firstDragon": "boolean",
+    "100_nbDragons": "Int8",
+    "100_firstRiftHerald": "boolean",
+    "100_nbRiftHeralds": "Int8",
+    "100_firstTower": "boolean",
+    "100_nbTowers": "Int8",
+    "100_win": "boolean",
+    "200_firstBaron": "boolean",
+    "200_nbBarons": "Int8",
+    "200_firstKill": "boolean",
+    "200_nbKills": "Int16",
+    "200_firstDragon": "boolean",
+    "200_nbDragons": "Int8",
+    "200_firstRiftHerald": "boolean",
+    "200_nbRiftHeralds": "Int8",
+    "200_firstTower": "boolean",
+    "200_nbTowers": "Int8",
+    "200_win": "boolean",
+}
+
+champs_dtypes = {
+    "matchId": "object",
+    "tier": tier_dtype,
+    "pick": "boolean",
+    "ban": "boolean",
+    "win": "boolean",
+    "assists": "Int16",
+    "deaths": "Int16",
+    "kills": "Int16",
+    # champions are integer ids, see load_champion_names. Files written before opponentId have it empty
+    "championId": "Int16",
+    "opponentId": "Int16",
+    "teamPosition": "category",
+    "teamId": "Int16",
+    "turn": "Int8",
+    "gameStartTime": "datetime64[ns]",
+}
+
+# types the CSV files are parsed to, before the conversion to the pandas types above
+arrow_types = {
+    "object": pa.string(),
+    "category": pa.dictionary(pa.int32(), pa.string()),
+    "boolean": pa.bool_(),
+    "Int8": pa.int8(),
+    "Int16": pa.int16(),
+    "Int32": pa.int32(),
+    "datetime64[ns]": pa.timestamp("s"),
+}
+
+# the nullable pandas types of the parsed columns, instead of floats and objects when a column has nulls
+pandas_types = {
+    pa.bool_(): pd.BooleanDtype(),
+    pa.int8(): pd.Int8Dtype(),
+    pa.int16(): pd.Int16Dtype(),
+    pa.int32(): pd.Int32Dtype(),
+}
+
+
+def get_cache_key(path, dtypes):
+    """
+    It returns what the cache of a file depends on: the size and modification time of the file, and
+    the columns and types read from it
+
+    :param path: the path of the CSV file
+    :param dtypes: a dictionary that maps the columns to read to their types
+    :return: A dictionary that can be compared with the key saved next to the cache
+    """
+    stat = os.stat(path)
+    return {
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'columns': [[column, str(dtype)] for column, dtype in dtypes.items()],
+    }
+
+def get_arrow_types(dtypes):
+    return {
+        column: arrow_types["category" if isinstance(dtype, pd.CategoricalDtype) else dtype]
+        for column, dtype in dtypes.items()
+    }
+
+def get_convert_options(dtypes):
+    return pa_csv.ConvertOptions(column_types=get_arrow_types(dtypes), include_columns=list(dtypes),
+                                 include_missing_columns=True, strings_can_be_null=True)
+
+def cast_table(table, dtypes):
+    # the types of the parquet files of the ingestion (int8 dictionaries, UTC timestamps) to those the
+    # CSV files are parsed to. Columns missing from the file are filled with nulls, like in the CSV files
+    columns = []
+    for column, arrow_type in get_arrow_types(dtypes).items():
+        if column in table.column_names:
+            columns.append(table.column(column).cast(arrow_type))
+        else:
+            columns.append(pa.nulls(table.num_rows, type=arrow_type))
+    return pa.Table.from_arrays(columns, names=list(dtypes))
+
+def is_parquet(path):
+    return path.endswith(".parquet")
+
+def to_typed_frame(table, dtypes):
+    df = table.to_pandas(types_mapper=pandas_types.get)
+
+    # categories with a fixed order (tier) are given their dtype, the others keep those of the file
+    for column, dtype in dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype(dtype)
+
+    return df
+
+def read_typed_csv(path, dtypes):
+    """
+    It reads the given columns of a CSV file, typed while parsing: the other columns are skipped and
+    no column goes through generic python objects, except the strings. Columns missing from the file
+    (files written before the column was added) are filled with empty values
+
+    :param path: the path of the CSV file
+    :param dtypes: a dictionary that maps the columns to read to their types
+    :return: A dataframe with the columns of `dtypes`, in this order
+    """
+    table = pa_csv.read_csv(path, convert_options=get_convert_options(dtypes))
+    return to_typed_frame(table, dtypes)
+
+def read_typed_parquet(path, dtypes):
+    """
+    It reads the given columns of a parquet file written by the ingestion, with the types of
+    read_typed_csv. The file is already typed, nothing is parsed
+
+    :param path: the path of the parquet file
+    :param dtypes: a dictionary that maps the columns to read to their types
+    :return: A dataframe with the columns of `dtypes`, in this order
+    """
+    columns = [column for column in dtypes if column in pq.read_schema(path).names]
+    return to_typed_frame(cast_table(pq.read_table(path, columns=columns), dtypes), dtypes)
+
+def read_typed_file(path, dtypes):
+    """
+    It reads a daily file, parquet or CSV, see read_typed_parquet and read_typed_csv
+    """
+    if is_parquet(path):
+        return read_typed_parquet(path, dtypes)
+    return read_typed_csv(path, dtypes)
+
+def iter_typed_parquet(path, dtypes, chunk_size=CHUNK_SIZE):
+    """
+    It reads a parquet file like read_typed_parquet, one chunk of rows at a time, about `chunk_size`
+    bytes of uncompressed data
+
+    :param path: the path of the parquet file
+    :param dtypes: a dictionary that maps the columns to read to their types
+    :param chunk_size: the number of bytes of the file read at a time
+    :return: An iterator of typed dataframes, at least one (empty for a file without rows)
+    """
+    parquet_file = pq.ParquetFile(path)
+    metadata = parquet_file.metadata
+    columns = [column for column in dtypes if column in parquet_file.schema_arrow.names]
+
+    row_bytes = sum(metadata.row_group(i).total_byte_size for i in range(metadata.num_row_groups)) / max(metadata.num_rows, 1)
+    batch_size = max(1, int(chunk_size / max(row_bytes, 1)))
+
+    empty = True
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+        empty = False
+        yield to_typed_frame(cast_table(pa.Table.from_batches([batch]), dtypes), dtypes)
+
+    if empty:
+        yield to_typed_frame(cast_table(parquet_file.schema_arrow.empty_table().select(columns), dtypes), dtypes)
+
+def iter_typed_file(path, dtypes, chunk_size=CHUNK_SIZE):
+    """
+    It reads a daily file, parquet or CSV, one chunk at a time, see iter_typed_parquet and iter_typed_csv
+    """
+    if is_parquet(path):
+        return iter_typed_parquet(path, dtypes, chunk_size)
+    return iter_typed_csv(path, dtypes, chunk_size)
+
+def iter_typed_csv(path, dtypes, chunk_size=CHUNK_SIZE):
+    """
+    It reads a CSV file like read_typed_csv, one chunk of rows at a time, so that the memory used
+    depends on the chunk size and not on the size of the file. The categories of a column can differ
+    from one chunk to the other
+
+    :param path: the path of the CSV file
+    :param dtypes: a dictionary that maps the columns to read to their types
+    :param chunk_size: the number of bytes of the file parsed at a time
+    :return: An iterator of typed dataframes, at least one (empty for a file without rows)
+    """
+    read_options = pa_csv.ReadOptions(block_size=chunk_size)
+    reader = pa_csv.open_csv(path, read_options=read_options, convert_options=get_convert_options(dtypes))
+
+    empty = True
+    for batch in reader:
+        empty = False
+        yield to_typed_frame(pa.Table.from_batches([batch]), dtypes)
+
+    if empty:
+        yield to_typed_frame(pa.Table.from_batches([], schema=reader.schema), dtypes)
+
+def load_file(path, dtypes, cache_directory=cache_directory):
+    """
+    It returns the typed dataframe of a daily file. A parquet file is read directly, it is typed
+    already. A CSV file is read from the cache if it did not change since the cache was written,
+    otherwise from the file, and then the cache is updated
+
+    :param path: the path of the parquet or CSV file
+    :param dtypes: a dictionary that maps the columns to read to their types
+    :param cache_directory: the directory of the parquet files, None to disable the cache
+    :return: A typed dataframe
+    """
+    if is_parquet(path):
+        return read_typed_parquet(path, dtypes)
+    if cache_directory is None:
+        return read_typed_csv(path, dtypes)
+
+    name = os.path.splitext(os.path.basename(path))[0]
+    cache_path = os.path.join(cache_directory, name + ".parquet")
+    key_path = os.path.join(cache_directory, name + ".json")
+    key = get_cache_key(path, dtypes)
+
+    if os.path.exists(cache_path) and os.path.exists(key_path):
+        with open(key_path, "r") as f:
+            if json.load(f) == key:
+                return pd.read_parquet(cache_path)
+
+    df = read_typed_csv(path, dtypes)
+
+    os.makedirs(cache_directory, exist_ok=True)
+    df.to_parquet(cache_path, index=False)
+    # the key is written last: a cache without its key is never read
+    with open(key_path, "w") as f:
+        json.dump(key, f)
+
+    return df
+
+def concat_typed(frames, dtypes):
+    """
+    It concatenates typed dataframes without losing the types: the categorical columns whose categories
+    depend on the file (e.g. gameVersion) are first given the sorted union of the categories of all
+    frames, the categories pandas would infer from the whole dataset
+
+    :param frames: the dataframes, with the same columns
+    :param dtypes: a dictionary that maps the columns to their types
+    :return: A dataframe
+    """
+    frames = [df for df in frames if len(df)] or frames[:1]
+    for column, dtype in dtypes.items():
+        if isinstance(dtype, str) and dtype == "category":
+            categories = union_categoricals([df[column] for df in frames]).categories.sort_values()
+            for df in frames:
+                df[column] = df[column].cat.set_categories(categories)
+
+    return pd.concat(frames, axis=0, ignore_index=True)
+
+def load_dataset(files, dtypes, cache_directory=cache_directory, workers=WORKERS):
+    """
+    It loads parquet or CSV files into one typed dataframe. Files are read at the same time by `workers` threads,
+    and only the files that changed since the last load are parsed again
+
+    :param files: the paths of the parquet or CSV files
+    :param dtypes: a dictionary that maps the columns to read to their types
+    :param cache_directory: the directory of the parquet files, None to disable the cache
+    :param workers: the number of files read at the same time
+    :return: A typed dataframe
+    """
+    if not files:
+        raise ValueError("No files to load")
+
+    load = partial(load_file, dtypes=dtypes, cache_directory=cache_directory)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        frames = list(executor.map(load, sorted(files)))
+
+    return concat_typed(frames, dtypes)
+
+def get_daily_files(directory, name):
+    """
+    It returns the daily files of an output, e.g. matches_data_20220601.csv or matches_data_euw1_20220601.csv.
+    The parquet file of a day (get_match_data with output_format='parquet') is preferred to its CSV
+    file, it does not need to be parsed. The shard files of a day (matches_data_20220601_DIAMOND.csv)
+    are left out, their rows are in the file of the day
+
+    :param directory: the directory of the files
+    :param name: the name of the output, 'matches_data' or 'champs_data'
+    :return: A list of paths
+    """
+    pattern = re.compile(r"^{}_(?:[a-z0-9]+_)?\d{{8}}\.(?:csv|parquet)$".format(name))
+    daily_files = {}
+    for path in sorted(glob.glob(os.path.join(directory, name + "_*"))):
+        if pattern.match(os.path.basename(path)):
+            label = os.path.splitext(path)[0]
+            if is_parquet(path) or label not in daily_files:
+                daily_files[label] = path
+    return list(daily_files.values())
+
+def load_matches(directory=data_directory, **kwargs):
+    """
+    It loads all the matches data files of a directory
+
+    :param directory: the directory of the matches_data_*.csv files
+    :return: A typed dataframe with the columns of matches_dtypes
+    """
+    return load_dataset(get_daily_files(directory, "matches_data"), matches_dtypes, **kwargs)
+
+def load_champs(directory=data_directory, **kwargs):
+    """
+    It loads all the champs data files of a directory
+
+    :param directory: the directory of the champs_data_*.csv files
+    :return: A typed dataframe with the columns of champs_dtypes
+    """
+    return load_dataset(get_daily_files(directory, "champs_data"), champs_dtypes, **kwargs)
+
+def get_version_key(path):
+    # champions_12.10.1.csv => (12, 10, 1)
+    version = os.path.basename(path)[len("champions_"):-len(".csv")]
+    return tuple(int(number) if number.isdigit() else 0 for number in version.split("."))
+
+def load_champion_names(directory=data_directory):
+    """
+    It reads the champions dimension files written by the ingestion (champions_<version>.csv). The
+    files of all the versions are read, the names of the latest version win
+
+    :param directory: the directory of the champions files
+    :return: A dictionary that maps championId to championName, empty if there is no file
+    """
+    champion_names = {}
+    for path in sorted(glob.glob(os.path.join(directory, "champions_*.csv")), key=get_version_key):
+        champions = pd.read_csv(path, usecols=["championId", "championName"])
+        champion_names.update(zip(champions["championId"].astype(int), champions["championName"]))
+    return champion_names
@@ -0,0 +1,208 @@
+# lane matchups: the games and wins of each champion against each lane opponent, by tier and position,
+# in dense count arrays. Mergeable like the histograms, and ranked once for the lookups
+
+import numpy as np
+import pandas as pd
+
+from loader import TIERS
+
+POSITIONS = ["TOP", "JUNGLE", "MIDDLE", "BOTTOM", "UTILITY"]
+
+# matchups with fewer games are not ranked, their winrate is mostly noise
+MIN_GAMES = 10
+
+
+def get_codes(values, categories):
+    """
+    It returns the position of each value in `categories`, -1 for the values that are not in it or
+    missing. A categorical column is recoded from its categories, without going through its values
+
+    :param values: e.g. the tier column
+    :param categories: a list of values, e.g. TIERS
+    :return: A numpy array of int64
+    """
+    values = pd.Series(values)
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # the code -1 of the missing values takes the last element, -1
+        recoded = np.append(pd.Index(categories).get_indexer(values.cat.categories.astype(object)), -1)
+        return recoded[values.cat.codes.to_numpy()].astype(np.int64)
+    return pd.Categorical(values.to_numpy(dtype=object), categories=categories).codes.astype(np.int64)
+
+
+class Matchups:
+    """
+    The games and wins of the matchups of the champions of `champion_ids`, in two arrays of shape
+    (tiers, positions, champions, opponents): games[t, p, c, o] is the number of games champion c played
+    against opponent o in its lane, wins[t, p, c, o] the number it won. The champions are indexed by
+    their code, their position in `champion_ids`, so the size of the arrays depends on the number of
+    champions, not on the number of games. Matchups of the same champions are merged by adding their
+    counts, so they can be built per day or per chunk and combined in any order.
+
+    rank() sorts the opponents of every champion once, then get_counters looks up the best counters or
+    the best matchups of a champion without going through the counts
+    """
+
+    def __init__(self, champion_ids, tiers=TIERS, positions=POSITIONS):
+        self.champion_ids = np.asarray(sorted(set(int(champion_id) for champion_id in champion_ids)), dtype=np.int64)
+        self.champion_codes = {champion_id: code for code, champion_id in enumerate(self.champion_ids.tolist())}
+        self.tiers = list(tiers)
+        self.positions = list(positions)
+
+        shape = (len(self.tiers), len(self.positions), len(self.champion_ids), len(self.champion_ids))
+        self.games = np.zeros(shape, dtype=np.int64)
+        self.wins = np.zeros(shape, dtype=np.int64)
+        # the opponents of each champion sorted by rank(), and the number of ranked ones
+        self.rankings = None
+        self.nb_ranked = None
+
+    def get_champion_codes(self, champion_ids):
+        # the code of each id, -1 for the ids that are not in the arrays or missing
+        ids = pd.to_numeric(pd.Series(champion_ids), errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+        if len(self.champion_ids) == 0:
+            return np.full(len(ids), -1, dtype=np.int64)
+
+        codes = np.searchsorted(self.champion_ids, ids).clip(0, len(self.champion_ids) - 1)
+        return np.where(self.champion_ids[codes] == ids, codes, -1)
+
+    def get_indexes(self, tiers, positions, champion_ids, opponent_ids):
+        # the flat index of each row in the count arrays, -1 for the rows outside of them
+        tier_codes = get_codes(tiers, self.tiers)
+        position_codes = get_codes(positions, self.positions)
+        codes = [self.get_champion_codes(ids) for ids in [champion_ids, opponent_ids]]
+
+        keep = (tier_codes >= 0) & (position_codes >= 0) & (codes[0] >= 0) & (codes[1] >= 0)
+        indexes = np.ravel_multi_index(
+            (tier_codes.clip(0), position_codes.clip(0), codes[0].clip(0), codes[1].clip(0)), self.games.shape
+        )
+        return np.where(keep, indexes, -1)
+
+    def update(self, tiers, positions, champion_ids, opponent_ids, wins):
+        """
+        It counts matchups, e.g. those of the picks of a chunk of champs rows. Rows whose tier,
+        position, champion or opponent is not one of the arrays, or is missing, are left out
+
+        :param tiers: the tier of each row
+        :param positions: the teamPosition of each row
+        :param champion_ids: the championId of each row
+        :param opponent_ids: the opponentId of each row, the championId of the lane opponent
+        :param wins: True for the rows whose champion won
+        :return: The matchups
+        """
+        indexes = self.get_indexes(tiers, positions, champion_ids, opponent_ids)
+        wins = pd.Series(wins).fillna(False).to_numpy(dtype=bool)
+        keep = indexes >= 0
+
+        self.games += np.bincount(indexes[keep], minlength=self.games.size).reshape(self.games.shape)
+        self.wins += np.bincount(indexes[keep & wins], minlength=self.wins.size).reshape(self.wins.shape)
+        self.rankings = None
+        return self
+
+    def merge(self, other):
+        """
+        It adds the counts of other matchups of the same champions, tiers and positions
+
+        :param other: Matchups
+        :return: The matchups
+        """
+        if (self.tiers != other.tiers or self.positions != other.positions
+                or not np.array_equal(self.champion_ids, other.champion_ids)):
+            raise ValueError("Matchups of different champions, tiers or positions cannot be merged")
+
+        self.games += other.games
+        self.wins += other.wins
+        self.rankings = None
+        return self
+
+    def to_frame(self):
+        """
+        It returns the matchups that were played, to store them
+
+        :return: A dataframe with the columns tier, teamPosition, championId, opponentId, games and wins
+        """
+        tier_codes, position_codes, codes, opponent_codes = np.nonzero(self.games)
+        return pd.DataFrame({
+            "tier": np.asarray(self.tiers, dtype=object)[tier_codes],
+            "teamPosition": np.asarray(self.positions, dtype=object)[position_codes],
+            "championId": self.champion_ids[codes],
+            "opponentId": self.champion_ids[opponent_codes],
+            "games": self.games[tier_codes, position_codes, codes, opponent_codes],
+            "wins": self.wins[tier_codes, position_codes, codes, opponent_codes],
+        })
+
+    def add_frame(self, frame):
+        """
+        It adds matchups returned by to_frame, of one or several days
+
+        :param frame: a dataframe with the columns of to_frame
+        :return: The matchups
+        """
+        indexes = self.get_indexes(frame["tier"], frame["teamPosition"], frame["championId"], frame["opponentId"])
+        keep = indexes >= 0
+
+        # one bincount sums the rows of all the days, its float64 sums of counts are exact
+        for counts, column in [(self.games, "games"), (self.wins, "wins")]:
+            weights = frame[column].to_numpy(dtype=np.float64)[keep]
+            counts += np.bincount(indexes[keep], weights=weights, minlength=counts.size).reshape(counts.shape).astype(np.int64)
+        self.rankings = None
+        return self
+
+    def rank(self, min_games=MIN_GAMES):
+        """
+        It sorts the opponents of each tier, position and champion by the winrate of the champion
+        against them, in both orders, the most played first on a tie. It is done once for all the
+        champions, with two sorts of the count arrays
+
+        :param min_games: the number of games under which a matchup is not ranked
+        :return: The matchups
+        """
+        with np.errstate(divide="ignore", invalid="ignore"):
+            winrates = self.wins / self.games
+        ranked = self.games >= max(min_games, 1)
+
+        # lexsort sorts by its last key first: the winrate, then the games. The matchups that are not
+        # ranked come last
+        self.rankings = {
+            worst: np.lexsort([-self.games, np.where(ranked, -winrates if worst else winrates, np.inf)], axis=-1).astype(np.int32)
+            for worst in [False, True]
+        }
+        self.nb_ranked = ranked.sum(axis=-1)
+        return self
+
+    def get_counters(self, champion_id, tier, position, k=5, worst=False, champion_names=None):
+        """
+        It returns the best counters of a champion in a tier and position: the lane opponents against
+        which it has the lowest winrate. With `worst`, the opponents against which it has the highest
+        winrate. The opponents are taken from the ranking of rank(), computed on the first call, so the
+        cost of a lookup depends on `k` only
+
+        :param champion_id: the championId of the champion
+        :param tier: the tier, e.g. 'DIAMOND'
+        :param position: the teamPosition, e.g. 'MIDDLE'
+        :param k: the number of opponents returned
+        :param worst: False for the best counters of the champion, True for its best matchups
+        :param champion_names: the names of the champions, see loader.load_champion_names
+        :return: A dataframe with the columns opponentId, opponentName, games, wins and winrate (that of
+        the champion against the opponent), empty for a champion without ranked matchups
+        """
+        if self.rankings is None:
+            self.rank()
+
+        tier_code, position_code = self.tiers.index(tier), self.positions.index(position)
+        code = self.champion_codes.get(int(champion_id))
+
+        opponent_codes = games = wins = np.zeros(0, dtype=np.int64)
+        if code is not None:
+            nb_ranked = self.nb_ranked[tier_code, position_code, code]
+            opponent_codes = self.rankings[worst][tier_code, position_code, code, :min(k, nb_ranked)]
+            games = self.games[tier_code, position_code, code, opponent_codes]
+            wins = self.wins[tier_code, position_code, code, opponent_codes]
+
+        opponent_ids = self.champion_ids[opponent_codes]
+        return pd.DataFrame({
+            "opponentId": opponent_ids,
+            # champions missing from the dimension files keep their id
+            "opponentName": [(champion_names or {}).get(opponent_id, str(opponent_id)) for opponent_id in opponent_ids.tolist()],
+            "games": games,
+            "wins": wins,
+            "winrate": wins / np.maximum(games, 1),
+        })
@@ -0,0 +1,81 @@
+# rankings of the champion statistics: the top K rows of each group, in one sort
+
+import numpy as np
+import pandas as pd
+
+
+def get_group_codes(column):
+    """
+    It returns integer codes of a group key, in the order groupby sorts the groups: the order of the
+    categories for a categorical column, the sorted values otherwise. Missing values get -1
+
+    :param column: a Series
+    :return: A numpy array of int64
+    """
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return column.cat.codes.to_numpy().astype(np.int64)
+    return pd.factorize(column, sort=True)[0].astype(np.int64)
+
+def top_k(df, by, metric, k=3, ascending=False):
+    """
+    It returns the `k` rows with the highest (or lowest) `metric` of each group, the groups in the order
+    of groupby. It gives the same rows as
+
+        df.groupby(by).apply(lambda x: x.sort_values([metric], ascending=ascending, kind='stable'))
+          .reset_index(drop=True).groupby(by).head(k)
+
+    index included, but with one sort of the whole frame instead of one sort per group. Ties keep the
+    order of `df`, rows with a missing metric come last and rows with a missing key are dropped, like
+    groupby does
+
+    :param df: the dataframe to rank
+    :param by: the columns of the groups, e.g. ['tier', 'teamPosition']
+    :param metric: the column to rank by, e.g. 'pick'
+    :param k: the number of rows kept in each group, defaults to 3
+    :param ascending: False to keep the highest values, True to keep the lowest
+    :return: A dataframe with the columns of `df`, indexed by the position of the rows in the whole
+    ranking
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    codes = [get_group_codes(df[column]) for column in by]
+
+    # rows with a missing key are not in any group
+    keep = np.logical_and.reduce([group_codes >= 0 for group_codes in codes])
+    df = df[keep]
+    codes = [group_codes[keep] for group_codes in codes]
+
+    values = df[metric].to_numpy(dtype=np.float64, na_value=np.nan)
+    sort_values = values if ascending else -values
+    sort_values = np.where(np.isnan(values), np.inf, sort_values)
+
+    # lexsort is stable and sorts by its last key first: groups, then the metric
+    order = np.lexsort([sort_values] + codes[::-1])
+    if len(order) == 0:
+        return df.iloc[order]
+
+    # rank of each sorted row in its group
+    sorted_codes = np.stack([group_codes[order] for group_codes in codes])
+    new_group = np.ones(len(order), dtype=bool)
+    new_group[1:] = (sorted_codes[:, 1:] != sorted_codes[:, :-1]).any(axis=0)
+    positions = np.arange(len(order))
+    group_start = np.maximum.accumulate(np.where(new_group, positions, 0))
+    selected = positions - group_start < k
+
+    result = df.iloc[order[selected]]
+    result.index = positions[selected]
+    return result
+
+def top_k_by_metrics(df, by, metrics, k=3):
+    """
+    It ranks the same groups by several metrics
+
+    :param df: the dataframe to rank
+    :param by: the columns of the groups
+    :param metrics: the metrics to rank by, a list of column names (highest first) or a dictionary that
+    maps each column to `ascending`
+    :param k: the number of rows kept in each group, defaults to 3
+    :return: A dictionary that maps each metric to its top_k dataframe
+    """
+    if not isinstance(metrics, dict):
+        metrics = {metric: False for metric in metrics}
+    return {metric: top_k(df, by, metric, k=k, ascending=ascending) for metric, ascending in metrics.items()}
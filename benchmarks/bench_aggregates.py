@@ -0,0 +1,59 @@
+# benchmark of the map-reduce aggregation of the daily files: the partial aggregates of every day
+# computed by 1, 2, 4... processes, against the threads of a single process
+#
+# usage: python benchmarks/bench_aggregates.py [--directory ingestion/data] [--chunk-size 16] [--repeat 1]
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "analyse"))
+
+from aggregates import load_daily_partials, get_champion_stats
+from loader import data_directory
+
+
+def measure(name, function, repeat):
+    best = None
+    for _ in range(repeat):
+        # an empty aggregates directory: every day is computed
+        with tempfile.TemporaryDirectory() as aggregates_directory:
+            start = time.perf_counter()
+            result = function(aggregates_directory)
+            elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    print("{:<32} {:>10.2f} s".format(name, best))
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of aggregates.load_daily_partials")
+    parser.add_argument("--directory", default=data_directory)
+    parser.add_argument("--chunk-size", type=int, default=16, help="in mb")
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    chunk_size = args.chunk_size * 1024 * 1024
+    cpu_count = os.cpu_count() or 1
+    print("{} cores".format(cpu_count))
+
+    # the typed cache of the loader is not used, both modes parse the CSV files
+    threads, (_, expected, _, _) = measure("threads of one process", lambda directory: load_daily_partials(
+        args.directory, directory, chunk_size=chunk_size), args.repeat)
+
+    processes = 1
+    while processes <= cpu_count:
+        elapsed, (_, champs_partials, _, _) = measure("{} processes".format(processes), lambda directory: load_daily_partials(
+            args.directory, directory, processes=processes, chunk_size=chunk_size), args.repeat)
+        pd.testing.assert_frame_equal(get_champion_stats(champs_partials), get_champion_stats(expected))
+        print("speedup: {:.1f}x".format(threads / elapsed))
+        processes *= 2
+
+
+if __name__ == "__main__":
+    main()
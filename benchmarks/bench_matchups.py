@@ -0,0 +1,115 @@
+# benchmark of the lane matchups of a window of days: a groupby of the raw champs rows by tier, position,
+# champion and opponent, then a filter and sort per lookup, against the per-day matchups partials merged
+# into the dense count arrays of matchups.Matchups, ranked once
+#
+# usage: python benchmarks/bench_matchups.py [--days 30] [--picks 100000] [--champions 160] [--lookups 1000] [--repeat 3]
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "analyse"))
+
+from aggregates import get_matchups_partial, get_matchups, add_day
+from loader import TIERS
+from matchups import POSITIONS, MIN_GAMES
+
+keys = ["tier", "teamPosition", "championId", "opponentId"]
+
+
+def make_picks(nb_picks, champion_ids, popularity, rng):
+    """
+    It builds the synthetic picks of a day with a lane opponent, the columns of the champs data used by
+    the matchups. Champions are picked with a skewed popularity, like in real games
+    """
+    return pd.DataFrame({
+        "tier": pd.Categorical.from_codes(rng.integers(0, len(TIERS), nb_picks), categories=TIERS, ordered=True),
+        "teamPosition": pd.Categorical.from_codes(rng.integers(0, len(POSITIONS), nb_picks), categories=POSITIONS),
+        "championId": pd.array(rng.choice(champion_ids, nb_picks, p=popularity), dtype="Int16"),
+        "opponentId": pd.array(rng.choice(champion_ids, nb_picks, p=popularity), dtype="Int16"),
+        "win": pd.array(rng.random(nb_picks) < 0.5, dtype="boolean"),
+    })
+
+
+def groupby_matchups(picks):
+    """
+    The matchups as a pairwise groupby of the raw rows
+    """
+    matchups = picks.groupby(keys, observed=True)["win"].agg(["size", "sum"]).reset_index()
+    return matchups.rename(columns={"size": "games", "sum": "wins"})
+
+
+def groupby_counters(matchups, champion_id, tier, position, k):
+    """
+    The best counters of a champion from the groupby: a filter and a sort of the matchups per lookup
+    """
+    lane = matchups[(matchups["tier"] == tier) & (matchups["teamPosition"] == position)
+                    & (matchups["championId"] == champion_id) & (matchups["games"] >= MIN_GAMES)]
+    lane = lane.assign(winrate=lane["wins"] / lane["games"])
+    return lane.sort_values(["winrate", "games"], ascending=[True, False], kind="stable").head(k)
+
+
+def measure(name, function, repeat):
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    print("{:<40} {:>10.1f} ms".format(name, best * 1000))
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of matchups.Matchups")
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--picks", type=int, default=100000, help="per day")
+    parser.add_argument("--champions", type=int, default=160)
+    parser.add_argument("--lookups", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    popularity = rng.zipf(1.5, args.champions).astype(np.float64)
+    popularity /= popularity.sum()
+    champion_ids = rng.choice(np.arange(1, 1000), args.champions, replace=False)
+    days = [make_picks(args.picks, champion_ids, popularity, rng) for _ in range(args.days)]
+    picks = pd.concat(days, ignore_index=True)
+    print("{} days, {} picks, {} champions, {} lookups".format(args.days, len(picks), args.champions, args.lookups))
+
+    # the partial of a day is computed once, when the day is added, and stored
+    start = time.perf_counter()
+    partials = pd.concat([add_day(get_matchups_partial(day), i) for i, day in enumerate(days)], ignore_index=True)
+    print("{:<40} {:>10.1f} ms".format("partial of a day", (time.perf_counter() - start) * 1000 / args.days))
+
+    rows = picks.sample(args.lookups, random_state=0)
+    lookups = list(zip(rows["championId"].astype(int), rows["tier"].astype(str), rows["teamPosition"].astype(str)))
+
+    groupby_build, grouped = measure("window, groupby of the rows", lambda: groupby_matchups(picks), args.repeat)
+    arrays_build, matchups = measure("window, merge of the days and ranking", lambda: get_matchups(partials).rank(), args.repeat)
+    print("speedup: {:.1f}x".format(groupby_build / arrays_build))
+
+    # same counters, in the same order
+    for champion_id, tier, position in lookups[:100]:
+        expected = groupby_counters(grouped, champion_id, tier, position, args.k)
+        counters = matchups.get_counters(champion_id, tier, position, k=args.k)
+        assert (counters["opponentId"].to_numpy() == expected["opponentId"].to_numpy()).all()
+        assert (counters["games"].to_numpy() == expected["games"].to_numpy()).all()
+
+    groupby_lookups, _ = measure("lookups, filter and sort", lambda: [
+        groupby_counters(grouped, champion_id, tier, position, args.k) for champion_id, tier, position in lookups
+    ], args.repeat)
+    arrays_lookups, _ = measure("lookups, ranking", lambda: [
+        matchups.get_counters(champion_id, tier, position, k=args.k) for champion_id, tier, position in lookups
+    ], args.repeat)
+    print("speedup: {:.1f}x".format(groupby_lookups / arrays_lookups))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+# benchmark of the top K champions per group: groupby/apply/sort_values/head, as in rank_different.py,
+# against the single sort of stats.top_k. With --directory, the champions statistics of the daily files of
+# the ingestion, loaded by loader.load_champs, are ranked instead of synthetic ones
+#
+# usage: python benchmarks/bench_top_k.py [--patches 20] [--champions 160] [--directory ingestion/data] [--k 3] [--repeat 3]
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "analyse"))
+
+from loader import load_champs
+from stats import top_k, top_k_by_metrics
+
+tiers = ["IRON", "BRONZE", "SILVER", "GOLD", "PLATINUM", "DIAMOND"]
+positions = ["TOP", "JUNGLE", "MIDDLE", "BOTTOM", "UTILITY"]
+by = ["tier", "teamPosition", "gameVersion"]
+
+
+def make_champs_stats(nb_patches, nb_champions, rng):
+    """
+    It builds a synthetic champs_stats frame: one row per tier, position, patch and champion, with
+    counts that have ties, like the aggregation of rank_different.py
+    """
+    index = pd.MultiIndex.from_product([
+        pd.Categorical(tiers, categories=tiers, ordered=True),
+        pd.Categorical(positions),
+        ["12.{}".format(patch) for patch in range(nb_patches)],
+        ["Champion{:03d}".format(champion) for champion in range(nb_champions)],
+    ], names=by + ["championName"])
+    champs_stats = index.to_frame(index=False)
+    size = len(champs_stats)
+
+    champs_stats["matchId"] = rng.integers(0, 600, size)
+    champs_stats["win"] = rng.integers(0, 300, size)
+    champs_stats["pick"] = champs_stats["matchId"]
+    champs_stats["kills"] = rng.normal(7.5, 1.0, size)
+    champs_stats["assists"] = rng.normal(8.0, 1.0, size)
+    champs_stats["deaths"] = rng.normal(7.5, 1.0, size)
+    champs_stats["KDA"] = (champs_stats["kills"] + champs_stats["assists"]) / champs_stats["deaths"]
+    return champs_stats
+
+
+def load_champs_stats(directory):
+    """
+    It aggregates the champs rows of the daily files by tier, position and champion, like
+    rank_different.py
+    """
+    champs = load_champs(directory, cache_directory=os.path.join(directory, "analysis_cache"))
+    picks = champs[champs["pick"].fillna(False)]
+    champs_stats = picks.groupby(["tier", "teamPosition", "championId"], observed=True).agg(
+        matchId=("matchId", "count"), win=("win", "sum"), pick=("pick", "sum"),
+        kills=("kills", "mean"), assists=("assists", "mean"), deaths=("deaths", "mean"),
+    ).reset_index()
+    champs_stats["KDA"] = (champs_stats["kills"] + champs_stats["assists"]) / champs_stats["deaths"]
+    return champs_stats
+
+
+def top_k_apply(champs_stats, metric, k, kind="quicksort"):
+    """
+    The ranking as written in rank_different.py before stats.top_k: one sort per group
+    """
+    ranked = champs_stats.groupby(by).apply(lambda x: x.sort_values([metric], ascending=False, kind=kind)).reset_index(drop=True)
+    return ranked.groupby(by).head(k)
+
+
+def measure(name, function, nb_rows, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    print("{:<32} {:>10.1f} ms {:>12.0f} rows/s".format(name, best * 1000, nb_rows / best))
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of stats.top_k")
+    parser.add_argument("--patches", type=int, default=20)
+    parser.add_argument("--champions", type=int, default=160)
+    parser.add_argument("--directory", default=None, help="rank the champs data files of this directory")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    global by
+    if args.directory:
+        by = ["tier", "teamPosition"]
+        champs_stats = load_champs_stats(args.directory)
+    else:
+        champs_stats = make_champs_stats(args.patches, args.champions, np.random.default_rng(0))
+    nb_groups = len(champs_stats.groupby(by, observed=True))
+    print("{} rows, {} groups, k = {}".format(len(champs_stats), nb_groups, args.k))
+
+    rankings = top_k_by_metrics(champs_stats, by, ["pick", "win", "KDA"], k=args.k)
+    for metric, after in rankings.items():
+        # same rows and index as a stable sort per group, and the same values as the default sort
+        pd.testing.assert_frame_equal(after, top_k_apply(champs_stats, metric, args.k, kind="stable"))
+        before = top_k_apply(champs_stats, metric, args.k)
+        assert (after.index == before.index).all()
+        assert (after[metric].to_numpy() == before[metric].to_numpy()).all()
+
+    before = measure("before (groupby/apply/sort)", lambda: top_k_apply(champs_stats, "pick", args.k), len(champs_stats), args.repeat)
+    after = measure("after (stats.top_k)", lambda: top_k(champs_stats, by, "pick", k=args.k), len(champs_stats), args.repeat)
+    print("speedup: {:.1f}x".format(before / after))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+# micro-benchmark of the match transform: matches per second before and after the per-match indexes,
+# and of transform + CSV writing with a dictionary per row against the column buffers of the pipeline
+#
+# usage (needs dependencies/common.py): python benchmarks/bench_transform.py [--matches 2000] [--repeat 5]
+
+import argparse
+import filecmp
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "ingestion"))
+
+from dependencies.get_match_data import filter_attributes_match_into, filter_attributes_match_batch, get_match_values, get_participants_win, get_lane_opponents, \
+    matches_fieldnames, champions_fieldnames, matches_columns, champions_columns
+from dependencies.sinks import CsvSink, ColumnBuffer, ColumnarCsvSink
+
+positions = ["TOP", "JUNGLE", "MIDDLE", "BOTTOM", "UTILITY"]
+champs_lookup = {str(champion_id): "Champion{}".format(champion_id) for champion_id in range(1, 161)}
+champion_ids = {name: int(champion_id) for champion_id, name in champs_lookup.items()}
+
+
+def make_match(match_number, rng):
+    """
+    It builds a synthetic ranked match with the fields read by the transform
+    """
+    participants = []
+    for team_id in [100, 200]:
+        for position in positions:
+            participants.append({
+                "assists": rng.randint(0, 20), "deaths": rng.randint(0, 15), "kills": rng.randint(0, 15),
+                "championId": rng.randint(1, 160), "teamPosition": position, "teamId": team_id,
+            })
+
+    blue_win = rng.random() < 0.5
+    teams = []
+    for team_id in [100, 200]:
+        objectives = {
+            objective: {"first": rng.random() < 0.5, "kills": rng.randint(0, 5)}
+            for objective in ["baron", "champion", "dragon", "riftHerald", "tower"]
+        }
+        bans = [{"championId": rng.randint(1, 160), "pickTurn": turn} for turn in range(1, 6)]
+        teams.append({"teamId": team_id, "win": (team_id == 100) == blue_win, "objectives": objectives, "bans": bans})
+
+    game_start = 1654000000000 + rng.randint(0, 86400000)
+    return {
+        "metadata": {"matchId": "EUW1_{}".format(match_number)},
+        "info": {
+            "gameStartTimestamp": game_start, "gameEndTimestamp": game_start + 1800000, "gameDuration": 1800,
+            "mapId": 11, "gameMode": "CLASSIC", "gameVersion": "12.10.446.9344", "teams": teams,
+            "participants": participants,
+        },
+    }
+
+
+def filter_attributes_match_obj_before(match_obj, tier, champs_lookup):
+    """
+    The transform as it was before the per-match indexes: the lane opponent is searched with a
+    `filter` over all participants, and the teams are scanned again for every participant
+    """
+    
+    match_stats = {}
+    champ_list = []
+
+    # get match stats
+    game_start_time = datetime.fromtimestamp(match_obj['info']['gameStartTimestamp'] // 1000)
+    game_end_time = datetime.fromtimestamp(match_obj['info']['gameEndTimestamp'] // 1000)
+
+    match_id= match_obj['metadata']['matchId']
+    match_stats['matchId'] = match_id
+    match_stats['tier'] = tier
+    match_stats['gameStartTimestamp'] = match_obj['info']['gameStartTimestamp']
+    match_stats['gameEndTimestamp'] = match_obj['info']['gameEndTimestamp']
+    match_stats['gameStartTime'] = game_start_time
+    match_stats['gameEndTime'] = game_end_time
+    match_stats['gameDuration'] = match_obj['info']['gameDuration']
+    match_stats['mapId'] = match_obj['info']['mapId']
+    match_stats['gameVersion'] = '.'.join(match_obj['info']['gameVersion'].split('.')[:2])
+
+    for team in match_obj['info']['teams']:
+        teamId = team['teamId']
+        objectives = team['objectives']
+
+        match_stats[str(teamId) + '_firstBaron'] = objectives['baron']['first']
+        match_stats[str(teamId) + '_nbBarons'] = objectives['baron']['kills']
+        match_stats[str(teamId) + '_firstKill'] = objectives['champion']['first']
+        match_stats[str(teamId) + '_nbKills'] = objectives['champion']['kills']
+        match_stats[str(teamId) + '_firstDragon'] = objectives['dragon']['first']
+        match_stats[str(teamId) + '_nbDragons'] = objectives['dragon']['kills']
+        match_stats[str(teamId) + '_firstRiftHerald'] = objectives['riftHerald']['first']
+        match_stats[str(teamId) + '_nbRiftHeralds'] = objectives['riftHerald']['kills']
+        match_stats[str(teamId) + '_firstTower'] = objectives['tower']['first']
+        match_stats[str(teamId) + '_nbTowers'] = objectives['tower']['kills']
+        match_stats[str(teamId) + '_win'] = team['win']
+
+    # get data about champions:  KDA of picked champs and ban turn for banned champs
+    champs_attributes = ['assists', 'deaths', 'kills', 'championId', 'teamPosition', 'teamId']
+
+    for participant in match_obj['info']['participants']:
+
+        pick_champ = {'matchId': match_id, 'gameStartTime': game_start_time, 'tier': tier, 'pick': True, 'ban' : False}
+        for attribute in champs_attributes:
+            pick_champ[attribute] = participant[attribute]
+
+        for team in match_obj['info']['teams']:
+            teamId = team['teamId']
+            if teamId == pick_champ['teamId']:
+                pick_champ['win'] = team['win']
+            else:
+                pick_champ['win'] = not team['win']
+            break
+            
+        pick_champ['championName'] = champs_lookup[str(pick_champ['championId'])]
+
+        opponent = filter(lambda p: p['teamPosition'] == pick_champ['teamPosition'] and p['teamId'] != pick_champ['teamId'],
+                                     match_obj['info']['participants'])
+        opponent = list(opponent)
+        if len(opponent) > 0:
+            pick_champ['opponent'] = champs_lookup[str(opponent[0]['championId'])]
+        else:
+            pick_champ['opponent'] = None
+        
+        champ_list.append(pick_champ)
+
+
+    for team in match_obj['info']['teams']:
+
+        teamId = team['teamId']
+        for ban in team['bans']:
+            ban_champ = {'matchId': match_id, 'gameStartTime': game_start_time, 'tier': tier, 'pick': False, 'ban': True, 'turn': ban['pickTurn'], 'championId': ban['championId'], 'teamId' : teamId }
+            
+            if ban_champ['championId'] == -1 :
+                ban_champ['championName'] = None
+            else:
+                ban_champ['championName'] = champs_lookup[str(ban_champ['championId'])]
+            
+            ban_champ['win'] = team['win']
+
+            champ_list.append(ban_champ)
+ 
+    result = {
+        'match_stats': match_stats, 
+        'champ_list': champ_list
+    }
+    return result
+
+
+def filter_attributes_match_dict(match_obj, tier, region=None):
+    """
+    The transform as it was before the column buffers: the per-match indexes, and a dictionary per row
+    """
+    match_stats = dict(zip(matches_fieldnames, get_match_values(match_obj, tier, region)))
+    champ_list = []
+
+    match_id = match_stats['matchId']
+    game_start_time = match_stats['gameStartTime']
+
+    champs_attributes = ['assists', 'deaths', 'kills', 'championId', 'teamPosition', 'teamId']
+    participants = match_obj['info']['participants']
+    participants_win = get_participants_win(participants, match_obj['info']['teams'])
+    opponents = get_lane_opponents(participants)
+
+    for participant, win, opponent in zip(participants, participants_win, opponents):
+        pick_champ = {'matchId': match_id, 'gameStartTime': game_start_time, 'tier': tier, 'pick': True, 'ban' : False, 'region': region}
+        for attribute in champs_attributes:
+            pick_champ[attribute] = participant[attribute]
+
+        pick_champ['win'] = win
+        pick_champ['opponentId'] = opponent['championId'] if opponent is not None else None
+        champ_list.append(pick_champ)
+
+    for team in match_obj['info']['teams']:
+        teamId = team['teamId']
+        for ban in team['bans']:
+            ban_champ = {'matchId': match_id, 'gameStartTime': game_start_time, 'tier': tier, 'pick': False, 'ban': True, 'turn': ban['pickTurn'], 'championId': ban['championId'], 'teamId' : teamId, 'region': region }
+            ban_champ['win'] = team['win']
+            champ_list.append(ban_champ)
+
+    return {'match_stats': match_stats, 'champ_list': champ_list}
+
+
+def transform_columns(match_objs, matches_buffer, champs_buffer):
+    """
+    The transform of the pipeline: the rows of each match appended to column buffers
+    """
+    matches_buffer.clear()
+    champs_buffer.clear()
+    for match_obj in match_objs:
+        filter_attributes_match_into(match_obj, "GOLD", matches_buffer, champs_buffer)
+
+
+def with_champion_ids(row):
+    """
+    A row of the transform before the champions dimension file: the names are replaced by the ids
+    """
+    ids = {k: v for k, v in row.items() if k not in ('championName', 'opponent')}
+    if 'opponent' in row:
+        ids['opponentId'] = champion_ids[row['opponent']] if row['opponent'] is not None else None
+    return ids
+
+
+def write_dict_rows(match_objs, directory):
+    """
+    The transform and writers as they were before the column buffers: a dictionary per row, written by
+    csv.DictWriter
+    """
+    with CsvSink(os.path.join(directory, "matches_dict.csv"), matches_fieldnames) as matches_sink, \
+            CsvSink(os.path.join(directory, "champs_dict.csv"), champions_fieldnames) as champs_sink:
+        for match_obj in match_objs:
+            transformed = filter_attributes_match_dict(match_obj, "GOLD", "euw1")
+            matches_sink.write(transformed['match_stats'])
+            champs_sink.write_rows(transformed['champ_list'])
+
+
+def write_columns(match_objs, directory):
+    with ColumnarCsvSink(os.path.join(directory, "matches_columns.csv"), matches_columns) as matches_sink, \
+            ColumnarCsvSink(os.path.join(directory, "champs_columns.csv"), champions_columns) as champs_sink:
+        for match_obj in match_objs:
+            filter_attributes_match_into(match_obj, "GOLD", matches_sink, champs_sink, "euw1")
+            matches_sink.flush_if_full()
+            champs_sink.flush_if_full()
+
+
+def measure(name, transform, match_objs, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        transform()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    print("{:<28} {:>10.0f} matches/s".format(name, len(match_objs) / best))
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the match transform")
+    parser.add_argument("--matches", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    match_objs = [make_match(match_number, rng) for match_number in range(args.matches)]
+
+    # same rows as before, apart from the region column and the champion ids added since
+    for match_obj in match_objs:
+        after = filter_attributes_match_dict(match_obj, "GOLD")
+        before = filter_attributes_match_obj_before(match_obj, "GOLD", champs_lookup)
+        after_rows = [after['match_stats']] + after['champ_list']
+        before_rows = [before['match_stats']] + [with_champion_ids(row) for row in before['champ_list']]
+        assert [{k: v for k, v in row.items() if k != 'region'} for row in after_rows] == before_rows
+
+    # same champs rows from the batch columns, the dates as text
+    batch = filter_attributes_match_batch(match_objs, ["GOLD"] * len(match_objs), "euw1")
+    rows = [row for m in match_objs for row in filter_attributes_match_dict(m, "GOLD", "euw1")['champ_list']]
+    assert batch['champ_list'] == {
+        name: [str(row[name]) if name == 'gameStartTime' else row.get(name) for row in rows] for name in champions_fieldnames
+    }
+
+    matches_buffer = ColumnBuffer(matches_columns)
+    champs_buffer = ColumnBuffer(champions_columns)
+
+    before = measure("before (filter per pick)", lambda: [filter_attributes_match_obj_before(m, "GOLD", champs_lookup) for m in match_objs], match_objs, args.repeat)
+    after = measure("per-match index, dict", lambda: [filter_attributes_match_dict(m, "GOLD") for m in match_objs], match_objs, args.repeat)
+    columns = measure("per-match index, columns", lambda: transform_columns(match_objs, matches_buffer, champs_buffer), match_objs, args.repeat)
+    measure("per-match index, batch", lambda: filter_attributes_match_batch(match_objs, ["GOLD"] * len(match_objs)), match_objs, args.repeat)
+    print("speedup: {:.2f}x, {:.2f}x with columns".format(before / after, before / columns))
+
+    with tempfile.TemporaryDirectory() as directory:
+        # same files from the dictionaries and from the column buffers of the pipeline
+        write_dict_rows(match_objs, directory)
+        write_columns(match_objs, directory)
+        for name in ["matches", "champs"]:
+            assert filecmp.cmp(os.path.join(directory, name + "_dict.csv"), os.path.join(directory, name + "_columns.csv"), shallow=False)
+
+        before = measure("write, dict per row", lambda: write_dict_rows(match_objs, directory), match_objs, args.repeat)
+        after = measure("write, column buffers", lambda: write_columns(match_objs, directory), match_objs, args.repeat)
+        print("speedup: {:.2f}x".format(before / after))
+
+
+if __name__ == "__main__":
+    main()
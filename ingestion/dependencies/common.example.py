@@ -1,9 +1,8 @@
 from datetime import datetime
-from google.cloud import storage, bigquery
 import os
 import csv
 import sys
-import os
+import threading
 
 X_RIOT_TOKEN="YOUR_RIOT_TOKEN"
 HOST="RIOT_HOST"
@@ -21,12 +20,58 @@ MATCHES_TABLE = "PROJECT.DATASET.MATCHES_TABLE"
 current_directory = os.path.dirname(__file__)
 data_directory = os.path.join(current_directory, '..', 'data')
 
+# local cache of raw API responses (match details are kept until evicted, league pages expire quickly)
+RESPONSE_CACHE_DIR = os.path.join(data_directory, 'response_cache')
+RESPONSE_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+
+# where the stages exchange their files: "gcs" uses CLOUD_STORAGE_BUCKET, "local" keeps the same
+# layout under LOCAL_STORAGE_ROOT, to run the whole pipeline on one host or offline
+STORAGE_BACKEND = "gcs"
+LOCAL_STORAGE_ROOT = os.path.join(data_directory, 'storage')
+
 # enable if run in local
 os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = "PATH_TO_GOOGLE_ACCOUNT_SERVICE_AUTH_FILE"
 
-storage_client = storage.Client()
-bigquery_client = bigquery.Client()
-bucket = storage_client.get_bucket(CLOUD_STORAGE_BUCKET)
+# the cloud clients are created on first use, so that importing a module (e.g. when the Airflow
+# scheduler parses the DAG) does not load the google libraries nor call the network
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_storage_client():
+    """
+    It returns the Cloud Storage client, created on the first call
+
+    :return: A google.cloud.storage.Client
+    """
+    with _clients_lock:
+        if 'storage' not in _clients:
+            from google.cloud import storage
+            _clients['storage'] = storage.Client()
+        return _clients['storage']
+
+def get_bigquery_client():
+    """
+    It returns the BigQuery client, created on the first call
+
+    :return: A google.cloud.bigquery.Client
+    """
+    with _clients_lock:
+        if 'bigquery' not in _clients:
+            from google.cloud import bigquery
+            _clients['bigquery'] = bigquery.Client()
+        return _clients['bigquery']
+
+def get_bucket():
+    """
+    It returns the bucket of the pipeline, fetched on the first call
+
+    :return: A google.cloud.storage.Bucket
+    """
+    storage_client = get_storage_client()
+    with _clients_lock:
+        if 'bucket' not in _clients:
+            _clients['bucket'] = storage_client.get_bucket(CLOUD_STORAGE_BUCKET)
+        return _clients['bucket']
 
 def get_date_label(date: datetime):
     year = date.year
@@ -50,14 +95,3 @@ def write_csv(data, path, mode, keys):
             dict_writer.writerows(data)
     except:
         print(sys.exc_info()[0], sys.exc_info()[1])
-
-def load_csv_to_bigquery(file_path, table_id):
-
-    job_config = bigquery.LoadJobConfig(
-        source_format=bigquery.SourceFormat.CSV, skip_leading_rows=1, autodetect=True,
-    )
-
-    with open(file_path, "rb") as source_file:
-        job = bigquery_client.load_table_from_file(source_file, table_id, job_config=job_config)
-
-    job.result()  # Waits for the job to complete.
\ No newline at end of file
@@ -1,227 +1,430 @@
 from datetime import datetime, timedelta
 import sys
 import os
-import requests
 import json
+from functools import partial
+from sys import intern
 from time import sleep
 
-from dependencies.common import HOST_EU, X_RIOT_TOKEN, get_date_label, data_directory, CLOUD_STORAGE_DATA_TEMP, CLOUD_STORAGE_SIDE_INPUT_DIR, CLOUD_STORAGE_DATA_DIR, bucket, read_csv, write_csv, load_csv_to_bigquery, CHAMPIONS_TABLE, MATCHES_TABLE
+from dependencies.common import HOST_EU, get_date_label, data_directory, CLOUD_STORAGE_DATA_TEMP, CLOUD_STORAGE_DATA_DIR, read_csv
+from dependencies.regions import get_region, get_file_label
+from dependencies.riot_client import get_client
+from dependencies.sinks import ColumnBuffer, ColumnarCsvSink
+from dependencies.storage import get_storage
+from dependencies.workers import bounded_map
+
+# columns of the outputs and the type of their values (see sinks.ColumnBuffer)
+matches_columns = [
+    ("matchId", "str"), ("tier", "str"), ("gameStartTimestamp", "int"), ("gameEndTimestamp", "int"),
+    ("gameStartTime", "str"), ("gameEndTime", "str"), ("gameDuration", "int"), ("mapId", "int"), ("gameVersion", "str"),
+] + [
+    column
+    for team_id in ["100", "200"]
+    for column in [
+        (team_id + "_firstBaron", "bool"), (team_id + "_nbBarons", "int"), (team_id + "_firstKill", "bool"),
+        (team_id + "_nbKills", "int"), (team_id + "_firstDragon", "bool"), (team_id + "_nbDragons", "int"),
+        (team_id + "_firstRiftHerald", "bool"), (team_id + "_nbRiftHeralds", "int"), (team_id + "_firstTower", "bool"),
+        (team_id + "_nbTowers", "int"), (team_id + "_win", "bool"),
+    ]
+] + [
+    ("region", "str"),
+]
+
+# champions are written as their integer id, their names are in the champions dimension file (see prepare)
+champions_columns = [
+    ("matchId", "str"), ("gameStartTime", "str"), ("tier", "str"), ("pick", "bool"), ("ban", "bool"), ("win", "bool"),
+    ("assists", "int"), ("deaths", "int"), ("kills", "int"), ("championId", "int"), ("opponentId", "int"),
+    ("teamPosition", "str"), ("teamId", "int"), ("turn", "int"), ("region", "str"),
+]
+
+matches_fieldnames = [name for name, _ in matches_columns]
+champions_fieldnames = [name for name, _ in champions_columns]
+
+# the objectives of a team, in the order of the team columns of matches_columns
+team_objectives = ['baron', 'champion', 'dragon', 'riftHerald', 'tower']
+
+# number of matches processed between two checkpoints
+CHECKPOINT_EVERY = 500
 
-def get_match_data_by_id(id):
+def get_match_data_by_id(id, host=HOST_EU):
     """
     It takes a match id and returns the match data
     
     :param id: the match id
+    :param host: the regional routing host of the region, defaults to HOST_EU
     :return: A JSON object with all the data of the match
     """
     endpoint = "/lol/match/v5/matches/{id}/".format(
         id=id)
-    url = "https://{HOST}{endpoint}".format(HOST=HOST_EU, endpoint=endpoint)
-    headers = {
-        "X-Riot-Token": X_RIOT_TOKEN
-    }
 
-    response = requests.get(url=url, headers=headers)
-    response_headers = response.headers
+    return get_client().get(host, endpoint, method="match-v5.getMatch")
+
+def get_match_values(match_obj, tier, region=None):
+    """
+    It returns the match statistics of a match object: one row of the matches data, as a tuple in the
+    order of matches_fieldnames. The strings repeated on every row (tier, gameVersion, region) are
+    interned, so that the rows of a buffer share them
     
-    if 'Retry-After' in response_headers:
-        time_sleep = response_headers['Retry-After']
-        print("Hit rate limit. Sleep {} seconds".format(time_sleep))
-        sleep(int(time_sleep))
-        print("Continue")
-        return get_match_data_by_id(id)
+    :param match_obj: the match object
+    :param tier: the tier of the match (e.g. 'DIAMOND')
+    :param region: the platform the match was crawled from (e.g. 'euw1')
+    :return: A tuple of match statistics
+    """
+    info = match_obj['info']
+    game_start_time = datetime.fromtimestamp(info['gameStartTimestamp'] // 1000)
+    game_end_time = datetime.fromtimestamp(info['gameEndTimestamp'] // 1000)
+    game_version = '.'.join(info['gameVersion'].split('.')[:2])
 
-    data_text = response.text
-    data_json = json.loads(data_text)
-    return data_json
+    teams_values = {}
+    for team in info['teams']:
+        objectives = team['objectives']
+        team_values = ()
+        for objective in team_objectives:
+            team_values += (objectives[objective]['first'], objectives[objective]['kills'])
+        teams_values[team['teamId']] = team_values + (team['win'],)
+
+    missing_team = (None,) * (2 * len(team_objectives) + 1)
+    return (
+        match_obj['metadata']['matchId'], intern(tier), info['gameStartTimestamp'], info['gameEndTimestamp'],
+        game_start_time, game_end_time, info['gameDuration'], info['mapId'], intern(game_version),
+    ) + teams_values.get(100, missing_team) + teams_values.get(200, missing_team) + (
+        intern(region) if region is not None else None,
+    )
+
+def get_participants_win(participants, teams):
+    """
+    It returns the win of each participant. As in the original transform, the result of the first
+    team decides: a participant wins if it is in the first team and it won, or in another team and
+    the first team lost
+    
+    :param participants: the participants of the match
+    :param teams: the teams of the match
+    :return: A list of booleans, in the order of the participants
+    """
+    first_team = teams[0]
+    return [first_team['win'] if participant['teamId'] == first_team['teamId'] else not first_team['win']
+            for participant in participants]
 
-def filter_attributes_match_obj(match_obj, tier, champs_lookup):
+def get_lane_opponents(participants):
     """
-    It takes a match object, a tier, and a lookup table of champion names and returns a dictionary with
-    two keys: 'match_stats' and 'champ_list'. 
+    It returns the lane opponent of each participant: the first participant of another team with the
+    same teamPosition. The participants are indexed once by (teamId, teamPosition), so each lookup
+    costs one access per team instead of a scan of all participants
     
-    The 'match_stats' key contains a dictionary of match statistics. The 'champ_list' key contains a
-    list of dictionaries, each of which contains information about a champion
+    :param participants: the participants of the match
+    :return: A list of participants (None when there is no opponent), in the order of the participants
+    """
+    lane_index = {}
+    team_ids = []
+    for order, participant in enumerate(participants):
+        lane_index.setdefault((participant['teamId'], participant['teamPosition']), (order, participant))
+        if participant['teamId'] not in team_ids:
+            team_ids.append(participant['teamId'])
+
+    opponents = []
+    for participant in participants:
+        opponent = None
+        for other_team_id in team_ids:
+            if other_team_id != participant['teamId']:
+                candidate = lane_index.get((other_team_id, participant['teamPosition']))
+                if candidate is not None and (opponent is None or candidate[0] < opponent[0]):
+                    opponent = candidate
+        opponents.append(opponent[1] if opponent is not None else None)
+
+    return opponents
+
+def extend_champs_columns(champs_columns, match_obj, match_values):
+    """
+    It appends the champs rows of a match object to the columns of a ColumnBuffer of champions_columns,
+    a whole column at a time: the picks, then the bans
+    
+    :param champs_columns: the lists of the columns, in the order of champions_columns
+    :param match_obj: the match object
+    :param match_values: the row of the match, from get_match_values
+    """
+    (match_ids, game_start_times, tiers, picks, bans, wins, assists, deaths, kills, champion_ids, opponent_ids,
+     team_positions, team_ids, turns, regions) = champs_columns
+    match_id, tier, game_start_time, region = match_values[0], match_values[1], match_values[4], match_values[-1]
+
+    info = match_obj['info']
+    participants = info['participants']
+    # championId is -1 when the team did not ban
+    teams_bans = [(team, ban) for team in info['teams'] for ban in team['bans']]
+    nb_picks, nb_bans = len(participants), len(teams_bans)
+    no_values = [None] * nb_bans
+
+    match_ids.extend([match_id] * (nb_picks + nb_bans))
+    game_start_times.extend([game_start_time] * (nb_picks + nb_bans))
+    tiers.extend([tier] * (nb_picks + nb_bans))
+    picks.extend([True] * nb_picks + [False] * nb_bans)
+    bans.extend([False] * nb_picks + [True] * nb_bans)
+    wins.extend(get_participants_win(participants, info['teams']) + [team['win'] for team, _ in teams_bans])
+    assists.extend([participant['assists'] for participant in participants] + no_values)
+    deaths.extend([participant['deaths'] for participant in participants] + no_values)
+    kills.extend([participant['kills'] for participant in participants] + no_values)
+    champion_ids.extend([participant['championId'] for participant in participants] + [ban['championId'] for _, ban in teams_bans])
+    opponent_ids.extend([opponent['championId'] if opponent is not None else None for opponent in get_lane_opponents(participants)] + no_values)
+    team_positions.extend([intern(participant['teamPosition']) for participant in participants] + no_values)
+    team_ids.extend([participant['teamId'] for participant in participants] + [team['teamId'] for team, _ in teams_bans])
+    turns.extend([None] * nb_picks + [ban['pickTurn'] for _, ban in teams_bans])
+    regions.extend([region] * (nb_picks + nb_bans))
+
+def filter_attributes_match_into(match_obj, tier, matches_buffer, champs_buffer, region=None):
+    """
+    It transforms a match object into its rows and appends them to column buffers, without building
+    a dictionary or a tuple per champs row. A match that fails to transform leaves the buffers unchanged
     
     :param match_obj: the match object
     :param tier: the tier of the match (e.g. 'DIAMOND')
-    :param champs_lookup: a dictionary that maps championId to championName
+    :param matches_buffer: a ColumnBuffer or ColumnarCsvSink of matches_columns
+    :param champs_buffer: a ColumnBuffer or ColumnarCsvSink of champions_columns
+    :param region: the platform the match was crawled from (e.g. 'euw1')
+    :return: The matchId
+    """
+    match_values = get_match_values(match_obj, tier, region)
+    # the dates are written as text, formatted once per match instead of once per row
+    match_values = match_values[:4] + (str(match_values[4]), str(match_values[5])) + match_values[6:]
+
+    nb_champs = len(champs_buffer)
+    try:
+        extend_champs_columns(champs_buffer.columns, match_obj, match_values)
+    except:
+        champs_buffer.truncate(nb_champs)
+        raise
+
+    matches_buffer.append(match_values)
+    return match_values[0]
+
+def filter_attributes_match_batch(match_objs, tiers, region=None):
     """
+    It transforms a batch of match objects into columns with filter_attributes_match_into. It returns
+    a dictionary with the keys 'match_stats' and 'champ_list', each mapping the output field names to
+    lists of values (None for a missing value)
     
-    match_stats = {}
-    champ_list = []
-
-    # get match stats
-    game_start_time = datetime.fromtimestamp(match_obj['info']['gameStartTimestamp'] // 1000)
-    game_end_time = datetime.fromtimestamp(match_obj['info']['gameEndTimestamp'] // 1000)
-
-    match_id= match_obj['metadata']['matchId']
-    match_stats['matchId'] = match_id
-    match_stats['tier'] = tier
-    match_stats['gameStartTimestamp'] = match_obj['info']['gameStartTimestamp']
-    match_stats['gameEndTimestamp'] = match_obj['info']['gameEndTimestamp']
-    match_stats['gameStartTime'] = game_start_time
-    match_stats['gameEndTime'] = game_end_time
-    match_stats['gameDuration'] = match_obj['info']['gameDuration']
-    match_stats['mapId'] = match_obj['info']['mapId']
-    match_stats['gameVersion'] = '.'.join(match_obj['info']['gameVersion'].split('.')[:2])
-
-    for team in match_obj['info']['teams']:
-        teamId = team['teamId']
-        objectives = team['objectives']
+    :param match_objs: a list of match objects
+    :param tiers: the tier of each match
+    :param region: the platform the matches were crawled from (e.g. 'euw1')
+    """
+    matches_buffer = ColumnBuffer(matches_columns)
+    champs_buffer = ColumnBuffer(champions_columns)
+
+    for match_obj, tier in zip(match_objs, tiers):
+        filter_attributes_match_into(match_obj, tier, matches_buffer, champs_buffer, region)
 
-        match_stats[str(teamId) + '_firstBaron'] = objectives['baron']['first']
-        match_stats[str(teamId) + '_nbBarons'] = objectives['baron']['kills']
-        match_stats[str(teamId) + '_firstKill'] = objectives['champion']['first']
-        match_stats[str(teamId) + '_nbKills'] = objectives['champion']['kills']
-        match_stats[str(teamId) + '_firstDragon'] = objectives['dragon']['first']
-        match_stats[str(teamId) + '_nbDragons'] = objectives['dragon']['kills']
-        match_stats[str(teamId) + '_firstRiftHerald'] = objectives['riftHerald']['first']
-        match_stats[str(teamId) + '_nbRiftHeralds'] = objectives['riftHerald']['kills']
-        match_stats[str(teamId) + '_firstTower'] = objectives['tower']['first']
-        match_stats[str(teamId) + '_nbTowers'] = objectives['tower']['kills']
-        match_stats[str(teamId) + '_win'] = team['win']
-
-    # get data about champions:  KDA of picked champs and ban turn for banned champs
-    champs_attributes = ['assists', 'deaths', 'kills', 'championId', 'teamPosition', 'teamId']
-
-    for participant in match_obj['info']['participants']:
-
-        pick_champ = {'matchId': match_id, 'gameStartTime': game_start_time, 'tier': tier, 'pick': True, 'ban' : False}
-        for attribute in champs_attributes:
-            pick_champ[attribute] = participant[attribute]
-
-        for team in match_obj['info']['teams']:
-            teamId = team['teamId']
-            if teamId == pick_champ['teamId']:
-                pick_champ['win'] = team['win']
-            else:
-                pick_champ['win'] = not team['win']
-            break
-            
-        pick_champ['championName'] = champs_lookup[str(pick_champ['championId'])]
-
-        opponent = filter(lambda p: p['teamPosition'] == pick_champ['teamPosition'] and p['teamId'] != pick_champ['teamId'],
-                                     match_obj['info']['participants'])
-        opponent = list(opponent)
-        if len(opponent) > 0:
-            pick_champ['opponent'] = champs_lookup[str(opponent[0]['championId'])]
-        else:
-            pick_champ['opponent'] = None
-        
-        champ_list.append(pick_champ)
-
-
-    for team in match_obj['info']['teams']:
-
-        teamId = team['teamId']
-        for ban in team['bans']:
-            ban_champ = {'matchId': match_id, 'gameStartTime': game_start_time, 'tier': tier, 'pick': False, 'ban': True, 'turn': ban['pickTurn'], 'championId': ban['championId'], 'teamId' : teamId }
-            
-            if ban_champ['championId'] == -1 :
-                ban_champ['championName'] = None
-            else:
-                ban_champ['championName'] = champs_lookup[str(ban_champ['championId'])]
-            
-            ban_champ['win'] = team['win']
-
-            champ_list.append(ban_champ)
- 
     result = {
-        'match_stats': match_stats, 
-        'champ_list': champ_list
+        'match_stats': dict(zip(matches_buffer.names, matches_buffer.columns)),
+        'champ_list': dict(zip(champs_buffer.names, champs_buffer.columns))
     }
     return result
 
-def get_match_data(date: datetime=None, **kwargs):
+def fetch_match(item, region=None):
+    """
+    It downloads the data of one match. It runs on the worker threads of `get_match_data`, which
+    transforms each match as soon as its response arrives
+    
+    :param item: a row of the matches id file, with the keys 'match_id' and 'tier'
+    :param region: the "platform:routing" pair of the region, defaults to the configured one
+    :return: The match object, or None if the match is skipped: not a classic game, or an error
+    answered by the API (e.g. 404). Other errors are raised, so that the day is not published without
+    the match
+    """
+    region_info = get_region(region)
+    id = item['match_id']
+
+    try:
+        match_data = get_match_data_by_id(id, host=region_info['regional_host'])
+        while 'status' in match_data and match_data['status']['status_code'] == 503:
+            sleep(1.0 * 2)
+            match_data = get_match_data_by_id(id, host=region_info['regional_host'])
+
+        if 'status' in match_data:
+            print("Skip match {}: {}".format(id, match_data['status']))
+            return None
+
+        if match_data['info']['gameMode'] != "CLASSIC" and match_data['info']['mapId'] != 11:
+            return None
+
+        return match_data
 
+    except:
+        print(id, sys.exc_info()[0], sys.exc_info()[1])
+        raise
+
+def get_checkpoint_paths(date_label):
     """
-    It reads a list of match IDs from a CSV file, downloads the match data from the Riot API, transforms
-    the data, and writes the transformed data to a CSV file
+    It returns the GCS paths of the progress marker and of the partial outputs of a day
     
-    :param date: The date to run the pipeline for
-    :type date: datetime
+    :param date_label: the date label, e.g. 20220601
+    :return: A dictionary with the keys 'progress', 'matches' and 'champs'
     """
-    if not date:
-        date = kwargs['execution_date']
+    return {
+        'progress': "{}/match_data_progress_{}.json".format(CLOUD_STORAGE_DATA_TEMP, date_label),
+        'matches': "{}/matches_data_{}.partial.csv".format(CLOUD_STORAGE_DATA_TEMP, date_label),
+        'champs': "{}/champs_data_{}.partial.csv".format(CLOUD_STORAGE_DATA_TEMP, date_label),
+    }
 
-    date_label = get_date_label(date)
+def save_checkpoint(date_label, processed, last_match_id, matches_data_csv, champs_data_csv):
+    """
+    It uploads the outputs written so far next to the temp data, then a progress marker saying how
+    many ids of the matches id file they cover. The marker is written last, so it never points to
+    partial outputs that were not uploaded
+    
+    :param date_label: the date label, e.g. 20220601
+    :param processed: the number of ids of the matches id file already processed
+    :param last_match_id: the last processed id, to check the file did not change on resume
+    :param matches_data_csv: the local matches output, flushed
+    :param champs_data_csv: the local champs output, flushed
+    """
+    paths = get_checkpoint_paths(date_label)
 
-    # read input
-    matches_id_csv_gcs = "{}/matches_id_{}.csv".format(CLOUD_STORAGE_DATA_TEMP, date_label)
-    matches_id_blob = bucket.blob(matches_id_csv_gcs)
+    get_storage().upload(matches_data_csv, paths['matches'])
+    get_storage().upload(champs_data_csv, paths['champs'])
 
-    matches_id_csv_local = os.path.join(data_directory, "matches_id_{date_label}.csv".format(date_label=date_label))
-    matches_id_blob.download_to_filename(matches_id_csv_local)
+    progress = {'processed': processed, 'last_match_id': last_match_id}
+    get_storage().write(paths['progress'], json.dumps(progress), content_type='application/json')
+    print("Checkpoint: {} matches processed".format(processed))
+
+def load_checkpoint(date_label, match_id_list, matches_data_csv, champs_data_csv):
+    """
+    It looks for the progress marker of a previous run of the same day. If it matches the current
+    matches id file, it downloads the partial outputs to the local output paths, so that the run
+    can append to them
     
-    match_id_list = read_csv(matches_id_csv_local)
+    :param date_label: the date label, e.g. 20220601
+    :param match_id_list: the rows of the matches id file
+    :param matches_data_csv: the local matches output
+    :param champs_data_csv: the local champs output
+    :return: The number of ids already processed, 0 if there is nothing to resume
+    """
+    paths = get_checkpoint_paths(date_label)
 
-    # side input
-    champs_lookup_path =  "{}/champs_lookup.json".format(CLOUD_STORAGE_SIDE_INPUT_DIR)
-    champs_lookup_blob = bucket.blob(champs_lookup_path)
-    champs_lookup = json.loads(champs_lookup_blob.download_as_string(client=None))
+    if not get_storage().exists(paths['progress']):
+        return 0
 
-    matches = []
-    champs = []
-    processed = 0
-    nb_to_process = len(match_id_list)
+    progress = json.loads(get_storage().read(paths['progress']))
+    processed = progress['processed']
+    if processed > len(match_id_list) or match_id_list[processed - 1]['match_id'] != progress['last_match_id']:
+        print("Checkpoint does not match the matches id file, start from the beginning")
+        return 0
 
-    for item in match_id_list:
+    get_storage().download(paths['matches'], matches_data_csv)
+    get_storage().download(paths['champs'], champs_data_csv)
 
-        # processed = processed + 1
-        # print("Process {} / {}".format(processed, nb_to_process))
+    print("Resume from checkpoint: {} matches already processed".format(processed))
+    return processed
 
-        id = item['match_id']
-        tier = item['tier']
+def clear_checkpoint(date_label):
+    """
+    It deletes the progress marker and the partial outputs of a day once its outputs are complete
+    
+    :param date_label: the date label, e.g. 20220601
+    """
+    for path in get_checkpoint_paths(date_label).values():
+        if get_storage().exists(path):
+            get_storage().delete(path)
 
-        try:
-            match_data = get_match_data_by_id(id)
-            # if 'status' in match_data and match_data['status']['status_code'] == 429:
-            #     print("Hit rate limit. Sleep 2 minutes")
-            #     sleep(60.0 * 2)
-            #     print("Continue")
-            #     match_data = get_match_data_by_id(id)
-            while 'status' in match_data and match_data['status']['status_code'] == 503:
-                sleep(1.0 * 2)
-                match_data = get_match_data_by_id(id)
+def has_rows(csv_path):
+    # a header and at least one row
+    with open(csv_path, "r", encoding='utf-8') as f:
+        return next(f, None) is not None and next(f, None) is not None
 
+def publish_match_data(date_label, matches_data_csv, champs_data_csv, output_format='csv'):
+    """
+    It uploads the matches and champs data of a day to the data directory, converted to parquet if
+    needed. load_match_data then loads them to BigQuery, replacing the partition of the day: a day
+    without matches is not published, so that it does not replace the data of the day
+    
+    :param date_label: the label of the files, e.g. 20220601
+    :param matches_data_csv: the local matches output
+    :param champs_data_csv: the local champs output
+    :param output_format: 'csv' or 'parquet', the format of the uploaded files
+    """
+    if not has_rows(matches_data_csv):
+        raise ValueError("No matches in {}, the day is not published".format(matches_data_csv))
+
+    if output_format == 'parquet':
+        # pyarrow is only imported when it is used, it takes longer to import than the rest of the pipeline
+        from dependencies.parquet import csv_to_parquet, matches_schema, champs_schema
+        matches_data_parquet = os.path.join(data_directory, "matches_data_{date_label}.parquet".format(date_label=date_label))
+        champs_data_parquet = os.path.join(data_directory, "champs_data_{date_label}.parquet".format(date_label=date_label))
+        csv_to_parquet(matches_data_csv, matches_data_parquet, matches_schema)
+        csv_to_parquet(champs_data_csv, champs_data_parquet, champs_schema)
+
+        # upload to the data directory
+        get_storage().upload(matches_data_parquet, "{}/matches_data_{}.parquet".format(CLOUD_STORAGE_DATA_DIR, date_label))
+        get_storage().upload(champs_data_parquet, "{}/champs_data_{}.parquet".format(CLOUD_STORAGE_DATA_DIR, date_label))
+    else:
+        # upload to the data directory
+        get_storage().upload(matches_data_csv, "{}/matches_data_{}.csv".format(CLOUD_STORAGE_DATA_DIR, date_label))
+        get_storage().upload(champs_data_csv, "{}/champs_data_{}.csv".format(CLOUD_STORAGE_DATA_DIR, date_label))
+
+def get_match_data(date: datetime=None, concurrency=1, checkpoint_every=CHECKPOINT_EVERY, output_format='csv',
+                   region=None, shard=None, **kwargs):
 
-            if match_data['info']['gameMode'] != "CLASSIC" and match_data['info']['mapId'] != 11:
-                # print(match_data['info']['gameMode'], match_data['info']['mapId'])
-                continue
+    """
+    It reads a list of match IDs from a CSV file, downloads the match data from the Riot API, transforms
+    the data, and writes the transformed data to a CSV file
+    
+    :param date: The date to run the pipeline for
+    :type date: datetime
+    :param concurrency: the number of match requests kept in flight, defaults to 1
+    :param checkpoint_every: the number of matches processed between two checkpoints. A restarted run
+    resumes from the last checkpoint of the same day
+    :param output_format: 'csv' or 'parquet', the format of the files uploaded to the data directory.
+    Parquet files are typed (small ints, dictionary encoded strings, timestamps) and compressed
+    :param region: the "platform:routing" pair of the region to crawl, defaults to the configured one.
+    Its platform fills the region column of the outputs
+    :param shard: a tier: the matches id file of this shard is read (see get_matches_id), and the outputs
+    are left as CSV files in the temp directory for merge_match_data. None processes the whole day
+    """
+    if not date:
+        date = kwargs['execution_date']
 
-            match_data_transformed = filter_attributes_match_obj(match_data, tier, champs_lookup)
+    date_label = get_file_label(get_date_label(date), region, shard)
 
-            matches.append(match_data_transformed['match_stats'])
-            champs.extend(match_data_transformed['champ_list'])
-            
-        except:
-            print(sys.exc_info()[0], sys.exc_info()[1])
-            continue
+    # read input
+    matches_id_csv_gcs = "{}/matches_id_{}.csv".format(CLOUD_STORAGE_DATA_TEMP, date_label)
+    matches_id_csv_local = os.path.join(data_directory, "matches_id_{date_label}.csv".format(date_label=date_label))
+    get_storage().download(matches_id_csv_gcs, matches_id_csv_local)
+    
+    match_id_list = read_csv(matches_id_csv_local)
 
     # output
     matches_data_csv = os.path.join(data_directory, "matches_data_{date_label}.csv".format(date_label=date_label))
     champs_data_csv = os.path.join(data_directory, "champs_data_{date_label}.csv".format(date_label=date_label))
 
-    # writeto csv
-    matches_fieldnames = [
-        "matchId","tier","gameStartTimestamp","gameEndTimestamp","gameStartTime","gameEndTime","gameDuration","mapId","gameVersion",
-        "100_firstBaron","100_nbBarons","100_firstKill","100_nbKills","100_firstDragon","100_nbDragons","100_firstRiftHerald",
-        "100_nbRiftHeralds","100_firstTower","100_nbTowers","100_win","200_firstBaron","200_nbBarons","200_firstKill","200_nbKills",
-        "200_firstDragon","200_nbDragons","200_firstRiftHerald","200_nbRiftHeralds","200_firstTower","200_nbTowers","200_win"
-    ]
-    write_csv(matches, matches_data_csv, 'w', matches_fieldnames)
-
-    champions_fieldnames = ["matchId","gameStartTime","tier","pick","ban","win","assists","deaths","kills",
-                                "championId","championName","opponent","teamPosition","teamId","turn"]
-    write_csv(champs, champs_data_csv, 'w', champions_fieldnames)
-
-    # upload to gcs
-    blob_matches = bucket.blob("{}/matches_data_{}.csv".format(CLOUD_STORAGE_DATA_DIR, date_label))
-    blob_matches.upload_from_filename(matches_data_csv)
-    blob_champs = bucket.blob("{}/champs_data_{}.csv".format(CLOUD_STORAGE_DATA_DIR, date_label))
-    blob_champs.upload_from_filename(champs_data_csv)
-
-    # batch load csv to bigquery (free!)
-    load_csv_to_bigquery(file_path=champs_data_csv, table_id=CHAMPIONS_TABLE)
-    load_csv_to_bigquery(file_path=matches_data_csv, table_id=MATCHES_TABLE)
\ No newline at end of file
+    processed = load_checkpoint(date_label, match_id_list, matches_data_csv, champs_data_csv)
+
+    fetch = partial(fetch_match, region=region)
+    platform = get_region(region)['platform']
+
+    # rows are appended to the column buffers of the sinks as each match arrives, and streamed to the csv files
+    mode = 'a' if processed else 'w'
+    with ColumnarCsvSink(matches_data_csv, matches_columns, mode) as matches_sink, ColumnarCsvSink(champs_data_csv, champions_columns, mode) as champs_sink:
+
+        items = match_id_list[processed:]
+        for item, match_data in zip(items, bounded_map(fetch, items, concurrency)):
+            processed = processed + 1
+
+            if match_data:
+                try:
+                    filter_attributes_match_into(match_data, item['tier'], matches_sink, champs_sink, platform)
+                except:
+                    print(sys.exc_info()[0], sys.exc_info()[1])
+                matches_sink.flush_if_full()
+                champs_sink.flush_if_full()
+
+            if processed % checkpoint_every == 0 and processed < len(match_id_list):
+                matches_sink.flush()
+                champs_sink.flush()
+                save_checkpoint(date_label, processed, match_id_list[processed - 1]['match_id'], matches_data_csv, champs_data_csv)
+
+    # the match index is updated by load_match_data, once the day is loaded
+    if shard is None:
+        publish_match_data(date_label, matches_data_csv, champs_data_csv, output_format)
+    else:
+        # merge_match_data combines the shards of the day and publishes them
+        get_storage().upload(matches_data_csv, "{}/matches_data_{}.csv".format(CLOUD_STORAGE_DATA_TEMP, date_label))
+        get_storage().upload(champs_data_csv, "{}/champs_data_{}.csv".format(CLOUD_STORAGE_DATA_TEMP, date_label))
+
+    clear_checkpoint(date_label)
\ No newline at end of file
@@ -1,41 +1,27 @@
-from time import sleep
 import os
 from datetime import datetime, timedelta
 
-from dependencies.common import HOST_EU, X_RIOT_TOKEN, get_date_label, data_directory, read_csv, write_csv, CLOUD_STORAGE_DATA_TEMP, bucket
-import requests
-import json
+from dependencies.common import HOST_EU, get_date_label, data_directory, read_csv, write_csv, CLOUD_STORAGE_DATA_TEMP
+from dependencies.match_index import load_match_index
+from dependencies.regions import get_region, get_file_label
+from dependencies.riot_client import get_client
+from dependencies.storage import get_storage
 import sys
 
-def get_matches_by_puuid(puuid, start_date, end_date):
+def get_matches_by_puuid(puuid, start_date, end_date, host=HOST_EU):
     """
     It takes a puuid, start date and end date and returns a list of match ids
     
     :param puuid: the player's unique ID
     :param start_date: The start date of the time frame you want to get matches from
     :param end_date: The end date of the range of matches to retrieve
+    :param host: the regional routing host of the region, defaults to HOST_EU
     :return: A list of match ids
     """
     endpoint = "/lol/match/v5/matches/by-puuid/{puuid}/ids?startTime={start_date}&endTime={end_date}&start=0&count=100".format(
         puuid=puuid, start_date=start_date, end_date=end_date)
-    url = "https://{HOST}{endpoint}".format(HOST=HOST_EU, endpoint=endpoint)
-    headers = {
-        "X-Riot-Token": X_RIOT_TOKEN
-    }
 
-    response = requests.get(url=url, headers=headers)
-    response_headers = response.headers
-    
-    if 'Retry-After' in response_headers:
-        time_sleep = response_headers['Retry-After']
-        print("Hit rate limit. Sleep {} seconds".format(time_sleep))
-        sleep(int(time_sleep))
-        print("Continue")
-        return get_matches_by_puuid(puuid, start_date, end_date)
-    
-    data_text = response.text
-    data_json = json.loads(data_text)
-    return data_json
+    return get_client().get(host, endpoint, method="match-v5.getMatchIdsByPUUID")
 
 def get_start_and_end_timestamp(date: datetime):
     """
@@ -58,65 +44,90 @@ def get_start_and_end_timestamp(date: datetime):
     }
     return result
 
-def get_matches_id(date: datetime=None, **kwargs):
+def get_matches_id(date: datetime=None, match_index=None, region=None, shards=None, **kwargs):
     """
     > Get the list of matches played by summoners in a given date range, and save the list of matches to
     a CSV file
     
     :param date: datetime=None, **kwargs
     :type date: datetime
+    :param match_index: the MatchIndex shared by the days of a backfill, loaded from GCS if not given
+    :param region: the "platform:routing" pair of the region to crawl, defaults to the configured one
+    :param shards: the tiers the day is split into for get_match_data (see its shard argument): one
+    matches id file per tier, suffixed by it. The matches of all the tiers are listed and claimed
+    together, so each match is in the file of one tier only, that of the first summoner who played it.
+    None writes one file for the day
     """
 
     if not date:
         date = kwargs['execution_date']
 
-    date_label = get_date_label(date)
-
-    summoners_csv_gcs = "{}/summoners_{}.csv".format(CLOUD_STORAGE_DATA_TEMP, date_label)
-    summoners_blob = bucket.blob(summoners_csv_gcs)
+    summoners_label = get_file_label(get_date_label(date), region)
+    regional_host = get_region(region)['regional_host']
 
-    summoners_csv_local = os.path.join(data_directory, "summoners_{date_label}.csv".format(date_label=date_label))
-    summoners_blob.download_to_filename(summoners_csv_local)
+    summoners_csv_gcs = "{}/summoners_{}.csv".format(CLOUD_STORAGE_DATA_TEMP, summoners_label)
+    summoners_csv_local = os.path.join(data_directory, "summoners_{date_label}.csv".format(date_label=summoners_label))
+    get_storage().download(summoners_csv_gcs, summoners_csv_local)
     
     summoners_data = read_csv(summoners_csv_local)
+    if shards is not None:
+        summoners_data = [item for item in summoners_data if item['tier'] in shards]
 
     date_range = get_start_and_end_timestamp(date)
     start_date = date_range['start']
     end_date = date_range['end']
 
+    # matches ingested on other days, or claimed by another day of the same backfill, are skipped. Those
+    # ingested on this day are listed again, so that running the day again publishes all its matches
+    if match_index is None:
+        match_index = load_match_index()
+    nb_already_ingested = 0
+
     tier_matches_list = []
-    matches_id_list = []
+    matches_id_set = set()
 
     for item in summoners_data:
         puuid = item['puuid']
         tier = item['tier']
         # print(puuid, tier, item['summonerName'])
         try :
-            match_data = get_matches_by_puuid(puuid, start_date, end_date)
+            match_data = get_matches_by_puuid(puuid, start_date, end_date, host=regional_host)
             # if 'status' in match_data and match_data['status']['status_code'] == 429:
             #     print("Hit rate limit. Sleep 2 minutes")
             #     sleep(60.0 * 2)
             #     print("Continue")
-            #     match_data = get_matches_by_puuid(puuid, start_date, end_date)
+            #     match_data = get_matches_by_puuid(puuid, start_date, end_date, host=regional_host)
             # print(match_data)
             for match_id in match_data:
-                if match_id not in matches_id_list:
-                    tier_matches_list.append({
-                        'tier': tier, 'match_id': match_id
-                    })
-                    matches_id_list.append(match_id)
+                if match_id in matches_id_set:
+                    continue
+                matches_id_set.add(match_id)
+
+                if not match_index.claim([match_id], get_date_label(date)):
+                    nb_already_ingested += 1
+                    continue
+
+                tier_matches_list.append({
+                    'tier': tier, 'match_id': match_id
+                })
                     
         except:
             print(sys.exc_info()[0], sys.exc_info()[1])
             print(match_data)
 
-    # print(tier_matches_list, matches_id_list)
-    tier_matches_id_csv_local = os.path.join(data_directory, "matches_id_{date_label}.csv".format(date_label=date_label))
-    write_csv(tier_matches_list, tier_matches_id_csv_local, 'w', keys=['tier', 'match_id'])
+    print("{} matches to fetch, {} already ingested".format(len(tier_matches_list), nb_already_ingested))
+
+    # one file per shard, written even if it is empty: its get_match_data task reads it
+    files_matches = {None: tier_matches_list}
+    if shards is not None:
+        files_matches = {shard: [item for item in tier_matches_list if item['tier'] == shard] for shard in shards}
 
-    tier_matches_id_csv_gcs = "{}/matches_id_{}.csv".format(CLOUD_STORAGE_DATA_TEMP, date_label)
-    tier_matches_id_blob = bucket.blob(tier_matches_id_csv_gcs)
+    for shard, matches_list in files_matches.items():
+        date_label = get_file_label(get_date_label(date), region, shard)
+        tier_matches_id_csv_local = os.path.join(data_directory, "matches_id_{date_label}.csv".format(date_label=date_label))
+        write_csv(matches_list, tier_matches_id_csv_local, 'w', keys=['tier', 'match_id'])
 
-    tier_matches_id_blob.upload_from_filename(tier_matches_id_csv_local)
+        tier_matches_id_csv_gcs = "{}/matches_id_{}.csv".format(CLOUD_STORAGE_DATA_TEMP, date_label)
+        get_storage().upload(tier_matches_id_csv_local, tier_matches_id_csv_gcs)
 
 
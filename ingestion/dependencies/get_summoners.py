@@ -1,20 +1,25 @@
 from datetime import datetime, timedelta
-from time import sleep
-import requests
-import json
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 import os
 import random
 
-from dependencies.common import HOST, X_RIOT_TOKEN, SUMMONERS_SIZE, CLOUD_STORAGE_DATA_TEMP, get_date_label, data_directory, bucket, write_csv
+from dependencies.common import HOST, SUMMONERS_SIZE, CLOUD_STORAGE_DATA_TEMP, get_date_label, data_directory
+from dependencies.storage import get_storage
+from dependencies.regions import get_region, get_file_label
+from dependencies.riot_client import get_client
+from dependencies.sinks import CsvSink
 
 divisions = ["I", "II", "III", "IV"]
 tiers = ["DIAMOND", "PLATINUM", "GOLD", "SILVER", "BRONZE", "IRON"]
 queues = ["RANKED_SOLO_5x5"]
 
+# number of entries in a page of the league-v4 entries endpoint
+LEAGUE_PAGE_SIZE = 205
+
 summoner_fieldnames = ["leagueId", "queueType", "tier",  "rank",  "summonerId", "summonerName",
                        "leaguePoints", "wins", "losses", "veteran", "inactive", "freshBlood", "hotStreak", "miniSeries"]
 
-def get_summoners_riot_api(queue, tier, division, page=1):
+def get_summoners_riot_api(queue, tier, division, page=1, host=HOST):
     """
     > This function takes in a queue, tier, division, and page number and returns a list of summoners in
     that queue, tier, and division
@@ -23,70 +28,99 @@ def get_summoners_riot_api(queue, tier, division, page=1):
     :param tier: The tier of the league
     :param division: I, II, III, IV
     :param page: The page number of the summoners to retrieve, defaults to 1 (optional)
+    :param host: the platform host of the region, defaults to HOST
     :return: A list of dictionaries. Each dictionary contains information about a summoner.
     """
 
     endpoint = "/lol/league/v4/entries/{queue}/{tier}/{division}?page={page}".format(
         queue=queue, tier=tier, division=division, page=page)
-    url = "https://{HOST}{endpoint}".format(HOST=HOST, endpoint=endpoint)
-    headers = {
-        "X-Riot-Token": X_RIOT_TOKEN
-    }
 
-    response = requests.get(url=url, headers=headers)
-    response_headers = response.headers
+    return get_client().get(host, endpoint, method="league-v4.getLeagueEntries")
 
-    if 'Retry-After' in response_headers:
-        time_sleep = response_headers['Retry-After']
-        print("Hit rate limit. Sleep {} seconds".format(time_sleep))
-        sleep(int(time_sleep))
-        print("Continue")
-        return get_summoners_riot_api(queue, tier, division, page=1)
 
-    data_text = response.text
-    data_json = json.loads(data_text)
-    return data_json
+def get_pages_needed(league):
+    # ~200 summoners/page: don't request more pages than the sample still needs
+    return -(-(league['size'] - len(league['summoners'])) // LEAGUE_PAGE_SIZE)
 
+def crawl_leagues(leagues, size, concurrency=1, host=HOST):
+    """
+    It samples `size` summoners of each queue, tier and division. The pages of all the leagues share
+    one pool of `concurrency` requests: the free requests go to the first leagues that still need
+    summoners, and the crawl of a league stops as soon as enough summoners are collected or a page
+    is empty
+    
+    :param leagues: a list of (queue, tier, division)
+    :param size: the number of summoners to sample per league
+    :param concurrency: the number of pages requested at the same time, defaults to 1
+    :param host: the platform host of the region, defaults to HOST
+    :return: A generator of the samples of the leagues, lists of at most `size` summoners, in the order
+    of `leagues`
+    """
+    concurrency = max(concurrency, 1)
+    states = [{'league': league, 'size': size, 'summoners': [], 'next_page': 1, 'in_flight': 0, 'done': size <= 0}
+              for league in leagues]
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        requests = {}
+        first = 0
+        while first < len(states):
+            for state in states[first:]:
+                while not state['done'] and len(requests) < concurrency and state['in_flight'] < get_pages_needed(state):
+                    queue, tier, division = state['league']
+                    request = executor.submit(get_summoners_riot_api, queue, tier, division, page=state['next_page'], host=host)
+                    requests[request] = state
+                    state['next_page'] += 1
+                    state['in_flight'] += 1
+
+            if requests:
+                finished, _ = wait(requests, return_when=FIRST_COMPLETED)
+                for request in finished:
+                    state = requests.pop(request)
+                    state['in_flight'] -= 1
+                    # error responses (e.g. {'status': ...}) count as the end of the league
+                    page_data = request.result()
+                    page_data = page_data if isinstance(page_data, list) else []
+                    state['summoners'].extend(page_data)
+                    if not page_data or len(state['summoners']) >= state['size']:
+                        state['done'] = True
+
+            # the samples are returned in order, as soon as the leagues before them are finished
+            while first < len(states) and states[first]['done'] and states[first]['in_flight'] == 0:
+                summoners_data = states[first]['summoners']
+                # only get SUMMONERS_SIZE random summoners instead of whole pages to reduce datasize
+                random.shuffle(summoners_data)
+                yield summoners_data[:size]
+                states[first] = None
+                first += 1
 
-def get_summoners(date: datetime=None, **kwagrs):
+def get_summoners(date: datetime=None, region=None, concurrency=1, **kwagrs):
     """
     > We get a list of summoners from the Riot API, and then write them to a CSV file
     
     :param date: datetime=None, **kwagrs
     :type date: datetime
+    :param region: the "platform:routing" pair of the region to crawl, defaults to the configured one
+    :param concurrency: the number of league pages requested at the same time, defaults to 1
     :return: The number of summoners in the list
     """
 
     if not date:
         date = kwagrs['execution_date']
 
-    if not os.path.isdir(data_directory):
-        os.mkdir(data_directory)
-
-    date_label = get_date_label(date)
+    os.makedirs(data_directory, exist_ok=True)
 
+    date_label = get_file_label(get_date_label(date), region)
+    platform_host = get_region(region)['platform_host']
 
-    summoners_list = []
-
-    for tier in tiers:
-        for division in divisions:
-            for queue in queues:
-                # 1 page, ~200 summoners/page -> about 200 summoners per (division/tier)
-                summoners_data = get_summoners_riot_api(
-                    division=division, tier=tier, queue=queue, page=1)
-                # only get first SUMMONERS_SIZE summoners instead of 200 to reduce datasize
-                random.shuffle(summoners_data)
-                summoners_list.extend(summoners_data[:SUMMONERS_SIZE])
+    leagues = [(queue, tier, division) for tier in tiers for division in divisions for queue in queues]
 
+    # each tier/division sample is written as soon as its crawl is finished
     summoners_csv_local = os.path.join(data_directory, "summoners_{date_label}.csv".format(date_label=date_label))
-    write_csv(summoners_list, summoners_csv_local, 'w', summoner_fieldnames)
+    with CsvSink(summoners_csv_local, summoner_fieldnames) as summoners_sink:
+        for summoners_data in crawl_leagues(leagues, SUMMONERS_SIZE, concurrency, host=platform_host):
+            summoners_sink.write_rows(summoners_data)
 
     summoners_csv_gcs = "{}/summoners_{}.csv".format(CLOUD_STORAGE_DATA_TEMP, date_label)
-    summoners_blob = bucket.blob(summoners_csv_gcs)
-
-    summoners_blob.upload_from_filename(summoners_csv_local)
-
-    return len(summoners_list)
-
+    get_storage().upload(summoners_csv_local, summoners_csv_gcs)
 
-               
\ No newline at end of file
+    return summoners_sink.nb_rows
@@ -1,105 +1,116 @@
 from datetime import datetime, timedelta
+from functools import partial
 from time import sleep
 import os
 
-from google.cloud import storage
-from dependencies.common import HOST, X_RIOT_TOKEN, get_date_label, data_directory, CLOUD_STORAGE_SIDE_INPUT_DIR, CLOUD_STORAGE_DATA_TEMP, bucket, storage_client, read_csv, write_csv
-import requests
-import json
+from dependencies.common import HOST, get_date_label, data_directory, CLOUD_STORAGE_DATA_TEMP, read_csv, write_csv
+from dependencies.puuid_store import PuuidStore
+from dependencies.regions import get_region, get_file_label
+from dependencies.riot_client import get_client
+from dependencies.storage import get_storage
+from dependencies.workers import bounded_map
 import sys
 
 
-def get_summoner_by_name(summoner_name):
+def get_summoner_by_name(summoner_name, host=HOST):
     """
     > This function takes a summoner name as input, and returns the summoner's information as a JSON
     object
     
     :param summoner_name: The name of the summoner you want to look up
+    :param host: the platform host of the region, defaults to HOST
     :return: A dictionary with the summoner's information
     """
     endpoint = "/lol/summoner/v4/summoners/by-name/{summoner_name}".format(
         summoner_name=summoner_name)
-    url = "https://{HOST}{endpoint}".format(HOST=HOST, endpoint=endpoint)
-    headers = {
-        "X-Riot-Token": X_RIOT_TOKEN
-    }
-
-    response = requests.get(url=url, headers=headers)
-    response_headers = response.headers
-
-    if 'Retry-After' in response_headers:
-        time_sleep = response_headers['Retry-After']
-        print("Hit rate limit. Sleep {} seconds".format(time_sleep))
-        sleep(int(time_sleep))
-        print("Continue")
-        return get_summoner_by_name(summoner_name)
-
-    data_text = response.text
-    data_json = json.loads(data_text)
-    return data_json
-
-def get_summoners_puuid(date: datetime=None, **kwargs):
+
+    return get_client().get(host, endpoint, method="summoner-v4.getBySummonerName")
+
+def resolve_puuid(summoner_name, retries=3, host=HOST):
+    """
+    It returns the puuid of a summoner, or None if the summoner does not exist or can not be
+    resolved after `retries` attempts
+    
+    :param summoner_name: The name of the summoner
+    :param retries: the number of attempts for transient errors, defaults to 3
+    :param host: the platform host of the region, defaults to HOST
+    :return: The puuid of the summoner, or None
+    """
+    summoner_data = None
+    for attempt in range(retries):
+        try :
+            summoner_data = get_summoner_by_name(summoner_name, host=host)
+
+            if 'status' in summoner_data and summoner_data['status']['status_code'] == 404:
+                print(summoner_name, " not found")
+                return None
+
+            if 'status' in summoner_data and summoner_data['status']['status_code'] >= 500:
+                sleep(1.0 * 2)
+                continue
+
+            return summoner_data['puuid']
+        except:
+            print(sys.exc_info()[0], sys.exc_info()[1])
+            print(summoner_name, summoner_data)
+
+    return None
+
+def get_summoners_puuid(date: datetime=None, concurrency=1, region=None, puuid_store=None, **kwargs):
     """
     It downloads the summoners.csv file from GCS, reads it, adds a new column puuid to it,
-    uploads it back to GCS, and update the summoners cache file in GCS
+    uploads it back to GCS, and update the puuid cache shards in GCS
     
     :param date: The date that the DAG is being run for
     :type date: datetime
+    :param concurrency: the number of cache misses resolved at the same time, defaults to 1
+    :param region: the "platform:routing" pair of the region to crawl, defaults to the configured one
+    :param puuid_store: the PuuidStore shared by the runs of a backfill, loaded from GCS if not given
     """
 
     if not date:
         date = kwargs['execution_date']
 
-    date_label = get_date_label(date)
+    date_label = get_file_label(get_date_label(date), region)
+    platform_host = get_region(region)['platform_host']
 
     # input: summoners csv file
     summoners_csv_gcs = "{}/summoners_{}.csv".format(CLOUD_STORAGE_DATA_TEMP, date_label)
-    summoners_blob = bucket.blob(summoners_csv_gcs)
 
     summoners_csv_local = os.path.join(data_directory, "summoners_{date_label}.csv".format(date_label=date_label))
-    summoners_blob.download_to_filename(summoners_csv_local)
+    get_storage().download(summoners_csv_gcs, summoners_csv_local)
 
     summoners_list = read_csv(summoners_csv_local)
 
-    # side input: puuid cache
-    puuid_cache = {}
-    puuid_cache_path =  "{}/puuid_cache.json".format(CLOUD_STORAGE_SIDE_INPUT_DIR)
-    puuid_cache_blob = bucket.blob(puuid_cache_path)
-    is_puuid_cache_exists = storage.Blob(name=puuid_cache_path, bucket=bucket).exists(storage_client)
+    # side input: puuid cache, shared by the runs of a backfill
+    if puuid_store is None:
+        puuid_store = PuuidStore()
+        puuid_store.load()
 
-    if is_puuid_cache_exists:
-        puuid_cache = json.loads(puuid_cache_blob.download_as_string(client=None))
+    # the first run after the legacy cache (keyed by name) seeds the store with the puuids it knows
+    puuid_store.migrate(summoners_list)
 
+    # serve hits from the cache, and resolve the distinct missing summoners concurrently
+    missing_summoners = {}
     for item in summoners_list:
-        name = item['summonerName']
+        puuid = puuid_store.get(item['summonerId'])
 
-        if name in puuid_cache:
-            print("Cache hit")
-            item['puuid'] = puuid_cache[name]
-            continue
+        if puuid:
+            item['puuid'] = puuid
+        else:
+            missing_summoners[item['summonerId']] = item['summonerName']
 
-        try :
-            summoner_data = get_summoner_by_name(name)
-
-            # if 'status' in summoner_data and summoner_data['status']['status_code'] == 429:
-            #     print("Hit rate limit. Sleep 2 minutes")
-            #     sleep(60.0 * 2)
-            #     print("Continue")
-            #     summoner_data = get_summoner_by_name(name)
-            
-            if 'status' in summoner_data and summoner_data['status']['status_code'] == 404:
-                print(name, " not found")
-                item['puuid'] = None
-                continue
+    print("Cache hit: {}, to resolve: {}".format(len(summoners_list) - len(missing_summoners), len(missing_summoners)))
 
-            puuid = summoner_data['puuid']
-            item['puuid'] = puuid
-            puuid_cache[name] = puuid
-        except:
-            print(sys.exc_info()[0], sys.exc_info()[1])
-            print(name, summoner_data)
-            item['puuid'] = None
-            continue
+    missing_names = list(missing_summoners.values())
+    resolved = dict(zip(missing_summoners, bounded_map(partial(resolve_puuid, host=platform_host), missing_names, concurrency)))
+    for summoner_id, puuid in resolved.items():
+        if puuid:
+            puuid_store.put(summoner_id, missing_summoners[summoner_id], puuid)
+
+    for item in summoners_list:
+        if 'puuid' not in item:
+            item['puuid'] = resolved[item['summonerId']]
 
     # print(summoners_list)
     summoners_list = [item for item in summoners_list if item['puuid']]
@@ -107,10 +118,8 @@ def get_summoners_puuid(date: datetime=None, **kwargs):
                        "leaguePoints", "wins", "losses", "veteran", "inactive", "freshBlood", "hotStreak", "miniSeries", "puuid"]
 
     write_csv(summoners_list, summoners_csv_local, 'w', summoner_puuid_fieldnames)
-    summoners_blob.upload_from_filename(summoners_csv_local)
+    get_storage().upload(summoners_csv_local, summoners_csv_gcs)
 
-    # ensure_ascii = False because some summoners name have accent
-    puuid_cache_serialized = json.dumps(puuid_cache, indent = 4, ensure_ascii=False)
-    puuid_cache_blob.upload_from_string(data=puuid_cache_serialized, content_type='application/json')
+    puuid_store.save()
         
 
@@ -0,0 +1,184 @@
+# load the matches and champs data of a day to their BigQuery tables
+
+import csv
+import os
+from datetime import datetime
+
+from dependencies.common import get_date_label, get_bigquery_client, data_directory, CLOUD_STORAGE_DATA_DIR, CHAMPIONS_TABLE, MATCHES_TABLE
+from dependencies.match_index import load_match_index, save_match_index
+from dependencies.regions import get_file_label
+from dependencies.storage import get_storage, GcsStorage
+
+# BigQuery types of the CSV columns, in the order of matches_fieldnames and champions_fieldnames
+matches_table_schema = [
+    ("matchId", "STRING"),
+    ("tier", "STRING"),
+    ("gameStartTimestamp", "INT64"),
+    ("gameEndTimestamp", "INT64"),
+    ("gameStartTime", "TIMESTAMP"),
+    ("gameEndTime", "TIMESTAMP"),
+    ("gameDuration", "INT64"),
+    ("mapId", "INT64"),
+    ("gameVersion", "STRING"),
+] + [
+    field
+    for team_id in ["100", "200"]
+    for field in [
+        (team_id + "_firstBaron", "BOOL"),
+        (team_id + "_nbBarons", "INT64"),
+        (team_id + "_firstKill", "BOOL"),
+        (team_id + "_nbKills", "INT64"),
+        (team_id + "_firstDragon", "BOOL"),
+        (team_id + "_nbDragons", "INT64"),
+        (team_id + "_firstRiftHerald", "BOOL"),
+        (team_id + "_nbRiftHeralds", "INT64"),
+        (team_id + "_firstTower", "BOOL"),
+        (team_id + "_nbTowers", "INT64"),
+        (team_id + "_win", "BOOL"),
+    ]
+] + [
+    ("region", "STRING"),
+]
+
+champs_table_schema = [
+    ("matchId", "STRING"),
+    ("gameStartTime", "TIMESTAMP"),
+    ("tier", "STRING"),
+    ("pick", "BOOL"),
+    ("ban", "BOOL"),
+    ("win", "BOOL"),
+    ("assists", "INT64"),
+    ("deaths", "INT64"),
+    ("kills", "INT64"),
+    ("championId", "INT64"),
+    ("opponentId", "INT64"),
+    ("teamPosition", "STRING"),
+    ("teamId", "INT64"),
+    ("turn", "INT64"),
+    ("region", "STRING"),
+]
+
+# table, file name prefix and schema of each load
+match_data_tables = [
+    (CHAMPIONS_TABLE, "champs_data", champs_table_schema),
+    (MATCHES_TABLE, "matches_data", matches_table_schema),
+]
+
+
+def get_load_job_config(output_format, schema, write_disposition):
+    """
+    It returns the configuration of a load job to a day partition of a table
+
+    :param output_format: 'csv' or 'parquet', the format of the files
+    :param schema: the (name, type) pairs of the columns. Parquet files carry their own types
+    (see dependencies.parquet), so it is only used for CSV files
+    :param write_disposition: WRITE_TRUNCATE to replace the partition, WRITE_APPEND to add to it
+    :return: A bigquery.LoadJobConfig
+    """
+    from google.cloud import bigquery
+
+    if output_format == 'parquet':
+        job_config = bigquery.LoadJobConfig(source_format=bigquery.SourceFormat.PARQUET)
+    else:
+        job_config = bigquery.LoadJobConfig(
+            source_format=bigquery.SourceFormat.CSV, skip_leading_rows=1,
+            schema=[bigquery.SchemaField(name, field_type) for name, field_type in schema],
+        )
+
+    # tables are partitioned by day of ingestion, the loads of a day replace its partition
+    job_config.time_partitioning = bigquery.TimePartitioning(type_=bigquery.TimePartitioningType.DAY)
+    job_config.write_disposition = write_disposition
+    job_config.schema_update_options = [bigquery.SchemaUpdateOption.ALLOW_FIELD_ADDITION]
+    return job_config
+
+def wait_for_jobs(jobs):
+    """
+    It waits for load jobs that run at the same time, so the wait is as long as the slowest one
+    """
+    for job in jobs:
+        job.result()  # Waits for the job to complete.
+        print("Loaded {} rows to {}".format(job.output_rows, job.destination))
+
+def get_published_match_ids(paths, output_format):
+    """
+    It reads the match ids of published matches data files
+
+    :param paths: the paths of the files in the storage
+    :param output_format: 'csv' or 'parquet', the format of the files
+    :return: A list of match ids
+    """
+    match_ids = []
+    for path in paths:
+        local_path = os.path.join(data_directory, os.path.basename(path))
+        get_storage().download(path, local_path)
+        if output_format == 'parquet':
+            import pyarrow.parquet as pq
+            match_ids.extend(pq.read_table(local_path, columns=["matchId"]).column("matchId").to_pylist())
+        else:
+            with open(local_path, "r", encoding='utf-8') as f:
+                match_ids.extend(row['matchId'] for row in csv.DictReader(f))
+    return match_ids
+
+def load_match_data(date: datetime=None, regions=None, output_format='csv', match_index=None, **kwargs):
+    """
+    It loads the matches and champs data of a day, for all its regions, to the day partition of their
+    BigQuery tables. Running it again for the same day replaces the partition instead of adding rows,
+    so the regions given must be all those of the day.
+    With the GCS storage, each table is loaded from the URIs of the files by one job, and the two jobs
+    run at the same time. With the local storage, the files are sent by one job each.
+
+    Once the day is loaded, its matches are added to the match index, so that the next days skip them.
+    The index is not changed by a failed load: running the day again fetches all its matches
+
+    :param date: The date to load
+    :type date: datetime
+    :param regions: the "platform:routing" pairs of the regions of the day, None for the configured one
+    :param output_format: 'csv' or 'parquet', the format written by get_match_data
+    :param match_index: the MatchIndex shared by the days of a backfill, loaded from GCS if not given
+    """
+    from google.cloud import bigquery
+
+    if not date:
+        date = kwargs['execution_date']
+
+    date_label = get_date_label(date)
+    regions = regions or [None]
+    storage = get_storage()
+    bigquery_client = get_bigquery_client()
+
+    sources = [
+        (table_id, schema, ["{}/{}_{}.{}".format(CLOUD_STORAGE_DATA_DIR, file_name, get_file_label(date_label, region), output_format)
+                            for region in regions])
+        for table_id, file_name, schema in match_data_tables
+    ]
+
+    # the partition is replaced by the files of all the regions, or not at all
+    missing_paths = [path for _, _, paths in sources for path in paths if not storage.exists(path)]
+    if missing_paths:
+        raise FileNotFoundError("The day is not loaded, missing files: {}".format(", ".join(missing_paths)))
+
+    if isinstance(storage, GcsStorage):
+        jobs = []
+        for table_id, schema, paths in sources:
+            job_config = get_load_job_config(output_format, schema, bigquery.WriteDisposition.WRITE_TRUNCATE)
+            jobs.append(bigquery_client.load_table_from_uri(
+                [storage.get_uri(path) for path in paths], "{}${}".format(table_id, date_label), job_config=job_config))
+        wait_for_jobs(jobs)
+    else:
+        # the first file replaces the partition, the next ones are appended once it is done
+        for i in range(len(regions)):
+            write_disposition = bigquery.WriteDisposition.WRITE_TRUNCATE if i == 0 else bigquery.WriteDisposition.WRITE_APPEND
+            jobs = []
+            for table_id, schema, paths in sources:
+                job_config = get_load_job_config(output_format, schema, write_disposition)
+                with open(storage.get_path(paths[i]), "rb") as source_file:
+                    jobs.append(bigquery_client.load_table_from_file(
+                        source_file, "{}${}".format(table_id, date_label), job_config=job_config))
+            wait_for_jobs(jobs)
+
+    # remember the ingested matches so that the next days skip them
+    matches_paths = [paths for table_id, schema, paths in sources if table_id == MATCHES_TABLE][0]
+    if match_index is None:
+        match_index = load_match_index()
+    match_index.add(get_published_match_ids(matches_paths, output_format), date_label)
+    save_match_index(match_index)
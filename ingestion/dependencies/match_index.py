@@ -0,0 +1,190 @@
+# persistent index of the match ids already ingested, shared between days
+
+import os
+import struct
+import threading
+from array import array
+
+from dependencies.common import CLOUD_STORAGE_SIDE_INPUT_DIR, data_directory
+from dependencies.storage import get_storage
+
+# version 2 keeps the day each match was ingested, version 1 files are read with an unknown day
+MAGIC = b"LOLMIDX2"
+MAGIC_V1 = b"LOLMIDX1"
+UNKNOWN_DAY = 0
+match_index_file = "match_index.bin"
+
+
+def split_match_id(match_id):
+    """
+    It splits a match id like "EUW1_5912345678" into its platform prefix and its numeric part
+
+    :param match_id: the match id
+    :return: A tuple (prefix, number), or (None, None) if the id does not have this shape
+    """
+    prefix, _, number = match_id.rpartition('_')
+    if not prefix or not number.isdigit():
+        return None, None
+    return prefix, int(number)
+
+def get_day(date_label):
+    # the day of the index entries, e.g. 20220601 for the date label "20220601"
+    return int(date_label)
+
+
+class MatchIndex:
+    """
+    The match ids already ingested, with the day they were ingested on. Ids are kept per platform
+    prefix as dictionaries of integers in memory (O(1) lookups), and as sorted arrays of int64 with
+    an array of int32 days on disk, about 12 bytes per match.
+
+    Runs that share one index (several days of a backfill) `claim` the ids they are going to fetch,
+    so that a match seen on several days is fetched only once. A match ingested on the day being run
+    is claimed again: running a day again fetches all its matches. Claimed ids are not saved: if the
+    run that claimed them fails, they are fetched again next time.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ids = {}
+        self.others = {}
+        self.claimed = set()
+
+    def get_ingestion_day(self, match_id):
+        """
+        It returns the day a match was ingested on
+
+        :param match_id: the match id
+        :return: The day as an integer (e.g. 20220601), UNKNOWN_DAY for the matches of a version 1
+        file, None if the match is not in the index
+        """
+        prefix, number = split_match_id(match_id)
+        if prefix is None:
+            return self.others.get(match_id)
+        return self.ids.get(prefix, {}).get(number)
+
+    def __contains__(self, match_id):
+        return self.get_ingestion_day(match_id) is not None
+
+    def __len__(self):
+        return sum(len(numbers) for numbers in self.ids.values()) + len(self.others)
+
+    def claim(self, match_ids, date_label):
+        """
+        It returns the ids that are neither claimed yet nor ingested on another day than `date_label`,
+        and marks them as claimed
+
+        :param match_ids: an iterable of match ids
+        :param date_label: the day being run, e.g. 20220601
+        :return: A list of the new ids, in the input order
+        """
+        day = get_day(date_label)
+        new_ids = []
+        with self.lock:
+            for match_id in match_ids:
+                if match_id in self.claimed:
+                    continue
+                ingestion_day = self.get_ingestion_day(match_id)
+                if ingestion_day is None or ingestion_day == day:
+                    self.claimed.add(match_id)
+                    new_ids.append(match_id)
+        return new_ids
+
+    def add(self, match_ids, date_label):
+        """
+        It adds the ids of the matches ingested on a day. A match already in the index keeps its day
+
+        :param match_ids: an iterable of match ids
+        :param date_label: the day the matches were loaded for, e.g. 20220601
+        """
+        day = get_day(date_label)
+        with self.lock:
+            for match_id in match_ids:
+                prefix, number = split_match_id(match_id)
+                if prefix is None:
+                    self.others.setdefault(match_id, day)
+                else:
+                    self.ids.setdefault(prefix, {}).setdefault(number, day)
+
+    def load(self, path):
+        with open(path, "rb") as f:
+            data = f.read()
+
+        if data[:len(MAGIC)] not in (MAGIC, MAGIC_V1):
+            raise ValueError("{} is not a match index file".format(path))
+        with_days = data[:len(MAGIC)] == MAGIC
+
+        offset = len(MAGIC)
+        (nb_prefixes,) = struct.unpack_from("<I", data, offset)
+        offset += 4
+        for _ in range(nb_prefixes):
+            (prefix_length,) = struct.unpack_from("<B", data, offset)
+            offset += 1
+            prefix = data[offset:offset + prefix_length].decode('utf-8')
+            offset += prefix_length
+            (count,) = struct.unpack_from("<Q", data, offset)
+            offset += 8
+            numbers = array('q')
+            numbers.frombytes(data[offset:offset + 8 * count])
+            offset += 8 * count
+            if with_days:
+                days = array('i')
+                days.frombytes(data[offset:offset + 4 * count])
+                offset += 4 * count
+            else:
+                days = [UNKNOWN_DAY] * count
+            self.ids.setdefault(prefix, {}).update(zip(numbers, days))
+
+        # the other ids are lines "id<TAB>day", version 1 files have no day
+        others = data[offset:].decode('utf-8')
+        for line in others.split('\n') if others else []:
+            match_id, _, day = line.partition('\t')
+            self.others[match_id] = int(day) if day else UNKNOWN_DAY
+
+    def save(self, path):
+        with self.lock:
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(MAGIC)
+                f.write(struct.pack("<I", len(self.ids)))
+                for prefix, numbers in sorted(self.ids.items()):
+                    prefix_bytes = prefix.encode('utf-8')
+                    f.write(struct.pack("<B", len(prefix_bytes)))
+                    f.write(prefix_bytes)
+                    f.write(struct.pack("<Q", len(numbers)))
+                    sorted_numbers = sorted(numbers)
+                    f.write(array('q', sorted_numbers).tobytes())
+                    f.write(array('i', [numbers[number] for number in sorted_numbers]).tobytes())
+                f.write('\n'.join("{}\t{}".format(match_id, day) for match_id, day in sorted(self.others.items())).encode('utf-8'))
+            os.replace(tmp_path, path)
+
+
+def load_match_index():
+    """
+    It downloads the match index from the side input directory and loads it. If there is no
+    index yet, it returns an empty one
+
+    :return: A MatchIndex
+    """
+    match_index = MatchIndex()
+    match_index_path = "{}/{}".format(CLOUD_STORAGE_SIDE_INPUT_DIR, match_index_file)
+    match_index_local = os.path.join(data_directory, match_index_file)
+
+    if get_storage().exists(match_index_path):
+        get_storage().download(match_index_path, match_index_local)
+        match_index.load(match_index_local)
+
+    return match_index
+
+
+def save_match_index(match_index):
+    """
+    It writes the match index locally and uploads it to the side input directory
+
+    :param match_index: the MatchIndex to save
+    """
+    match_index_path = "{}/{}".format(CLOUD_STORAGE_SIDE_INPUT_DIR, match_index_file)
+    match_index_local = os.path.join(data_directory, match_index_file)
+
+    match_index.save(match_index_local)
+    get_storage().upload(match_index_local, match_index_path)
@@ -0,0 +1,70 @@
+# combine the match data of the shards of a day (see the shards argument of get_matches_id and the shard argument of get_match_data)
+
+import csv
+import os
+from datetime import datetime
+
+from dependencies.common import get_date_label, data_directory, CLOUD_STORAGE_DATA_TEMP
+from dependencies.get_match_data import matches_fieldnames, champions_fieldnames, publish_match_data
+from dependencies.get_summoners import tiers
+from dependencies.regions import get_file_label
+from dependencies.sinks import CsvSink
+from dependencies.storage import get_storage
+
+
+def merge_match_data(date: datetime=None, shards=None, output_format='csv', region=None, **kwargs):
+    """
+    It concatenates the matches and champs data of the shards of a day into the files of the day, and
+    publishes them like an unsharded run of get_match_data. get_matches_id puts each match in one shard;
+    a match found in several shards anyway (e.g. shards listed by separate runs) keeps the rows of the
+    first shard only. The matches
+    are added to the match index by load_match_data, once the day is loaded. The files of the shards
+    are deleted once the day is published
+
+    :param date: The date to merge
+    :type date: datetime
+    :param shards: the tiers the day was split into, in order of priority, defaults to all the tiers
+    :param output_format: 'csv' or 'parquet', the format of the published files
+    :param region: the "platform:routing" pair of the region, defaults to the configured one
+    :return: The number of matches of the day
+    """
+    if not date:
+        date = kwargs['execution_date']
+    shards = shards or tiers
+
+    date_label = get_file_label(get_date_label(date), region)
+    matches_data_csv = os.path.join(data_directory, "matches_data_{date_label}.csv".format(date_label=date_label))
+    champs_data_csv = os.path.join(data_directory, "champs_data_{date_label}.csv".format(date_label=date_label))
+
+    matches_id = set()
+    # the local path and the temp path of each shard file
+    shard_paths = []
+    with CsvSink(matches_data_csv, matches_fieldnames) as matches_sink, CsvSink(champs_data_csv, champions_fieldnames) as champs_sink:
+        for shard in shards:
+            shard_label = get_file_label(get_date_label(date), region, shard)
+            shard_files = {}
+            for name in ["matches_data", "champs_data"]:
+                shard_files[name] = os.path.join(data_directory, "{}_{}.csv".format(name, shard_label))
+                shard_paths.append((shard_files[name], "{}/{}_{}.csv".format(CLOUD_STORAGE_DATA_TEMP, name, shard_label)))
+                get_storage().download(shard_paths[-1][1], shard_files[name])
+
+            shard_matches_id = set()
+            with open(shard_files["matches_data"], "r", encoding='utf-8') as f:
+                for row in csv.DictReader(f):
+                    if row['matchId'] not in matches_id:
+                        shard_matches_id.add(row['matchId'])
+                        matches_sink.write(row)
+
+            with open(shard_files["champs_data"], "r", encoding='utf-8') as f:
+                champs_sink.write_rows(row for row in csv.DictReader(f) if row['matchId'] in shard_matches_id)
+
+            print("Shard {}: {} matches".format(shard, len(shard_matches_id)))
+            matches_id.update(shard_matches_id)
+
+    publish_match_data(date_label, matches_data_csv, champs_data_csv, output_format)
+
+    for local_path, temp_path in shard_paths:
+        os.remove(local_path)
+        get_storage().delete(temp_path)
+
+    return len(matches_id)
@@ -0,0 +1,91 @@
+# typed parquet versions of the matches and champs outputs
+
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+PARQUET_COMPRESSION = "zstd"
+
+# strings with few distinct values are dictionary encoded
+category = pa.dictionary(pa.int8(), pa.string())
+
+# UTC timestamps, which BigQuery loads as TIMESTAMP like the columns of the CSV schema. Naive ones
+# would be loaded as DATETIME
+timestamp = pa.timestamp("ms", tz="UTC")
+
+matches_schema = pa.schema([
+    ("matchId", pa.string()),
+    ("tier", category),
+    ("gameStartTimestamp", pa.int64()),
+    ("gameEndTimestamp", pa.int64()),
+    ("gameStartTime", timestamp),
+    ("gameEndTime", timestamp),
+    ("gameDuration", pa.int32()),
+    ("mapId", pa.int16()),
+    ("gameVersion", category),
+] + [
+    field
+    for team_id in ["100", "200"]
+    for field in [
+        (team_id + "_firstBaron", pa.bool_()),
+        (team_id + "_nbBarons", pa.int8()),
+        (team_id + "_firstKill", pa.bool_()),
+        (team_id + "_nbKills", pa.int16()),
+        (team_id + "_firstDragon", pa.bool_()),
+        (team_id + "_nbDragons", pa.int8()),
+        (team_id + "_firstRiftHerald", pa.bool_()),
+        (team_id + "_nbRiftHeralds", pa.int8()),
+        (team_id + "_firstTower", pa.bool_()),
+        (team_id + "_nbTowers", pa.int8()),
+        (team_id + "_win", pa.bool_()),
+    ]
+] + [
+    ("region", category),
+])
+
+champs_schema = pa.schema([
+    ("matchId", pa.string()),
+    ("gameStartTime", timestamp),
+    ("tier", category),
+    ("pick", pa.bool_()),
+    ("ban", pa.bool_()),
+    ("win", pa.bool_()),
+    ("assists", pa.int16()),
+    ("deaths", pa.int16()),
+    ("kills", pa.int16()),
+    ("championId", pa.int16()),
+    ("opponentId", pa.int16()),
+    ("teamPosition", category),
+    ("teamId", pa.int16()),
+    ("turn", pa.int8()),
+    ("region", category),
+])
+
+
+def get_parse_type(field_type):
+    if pa.types.is_dictionary(field_type):
+        return field_type.value_type
+    if pa.types.is_timestamp(field_type):
+        return pa.timestamp(field_type.unit)
+    return field_type
+
+
+def csv_to_parquet(csv_path, parquet_path, schema):
+    """
+    It converts a CSV output of the pipeline to a typed, compressed parquet file. The CSV file is
+    read in blocks, so memory does not depend on the size of the file
+
+    :param csv_path: the path of the CSV file
+    :param parquet_path: the path of the parquet file to write
+    :param schema: the schema of the parquet file, its field names are the CSV columns
+    """
+    # parse with the plain value types, then cast to the dictionary encoded schema. The times of the
+    # CSV files have no zone: they are parsed as naive timestamps, and the cast reads them as UTC
+    parse_types = {field.name: get_parse_type(field.type) for field in schema}
+    convert_options = pa_csv.ConvertOptions(column_types=parse_types, strings_can_be_null=True)
+    reader = pa_csv.open_csv(csv_path, convert_options=convert_options)
+
+    with pq.ParquetWriter(parquet_path, schema, compression=PARQUET_COMPRESSION) as writer:
+        for batch in reader:
+            table = pa.Table.from_batches([batch]).select(schema.names)
+            writer.write_table(table.cast(schema))
@@ -1,26 +1,42 @@
-# create champs lookup and put on gcs
+# create the champions dimension file and put it in the data directory
 
-import requests, json
-from dependencies.common import CLOUD_STORAGE_SIDE_INPUT_DIR, bucket
+import os
+from dependencies.common import CLOUD_STORAGE_DATA_DIR, data_directory, write_csv
+from dependencies.storage import get_storage
+
+# the Data Dragon version the champion names are taken from
+CHAMPIONS_VERSION = "12.10.1"
+
+champions_fieldnames = ["championId", "championName", "version"]
+
+def get_champions_file_name(version=CHAMPIONS_VERSION):
+    """
+    It returns the name of the champions dimension file of a Data Dragon version, e.g. champions_12.10.1.csv
+
+    :param version: the Data Dragon version
+    :return: A file name
+    """
+    return "champions_{}.csv".format(version)
 
 def prepare():
     """
-    It downloads the latest champion data from Riot's API, converts the champion name to champion id,
-    and uploads the result to a file in Cloud Storage
+    It downloads the champion data of a Data Dragon version from Riot's API and writes the champions
+    dimension file: the name of each championId, the integer the champs data is written with. The file
+    is versioned, a new version adds the new champions without changing the files of the older ones
     """
-    champs_data_url="http://ddragon.leagueoflegends.com/cdn/12.10.1/data/en_US/champion.json"
+    import requests
+    champs_data_url="http://ddragon.leagueoflegends.com/cdn/{}/data/en_US/champion.json".format(CHAMPIONS_VERSION)
     response = requests.get(champs_data_url)
     champs_data = response.json()
 
-    # convert Name - Id to Id - Name
     champs_data = champs_data['data']
-    id_name_map = {}
-
-    for champ in champs_data:
-        champ_id = champs_data[champ]['key']
-        id_name_map[champ_id] = champ
-    
-    id_name_map_serialized = json.dumps(id_name_map, indent = 4, ensure_ascii=False)
-    champs_lookup_path =  "{}/champs_lookup.json".format(CLOUD_STORAGE_SIDE_INPUT_DIR)
-    champs_lookup_blob = bucket.blob(champs_lookup_path)
-    champs_lookup_blob.upload_from_string(data=id_name_map_serialized, content_type='application/json')
+    champions = [
+        {'championId': int(champs_data[champ]['key']), 'championName': champ, 'version': CHAMPIONS_VERSION}
+        for champ in champs_data
+    ]
+    champions.sort(key=lambda champion: champion['championId'])
+
+    os.makedirs(data_directory, exist_ok=True)
+    champions_csv = os.path.join(data_directory, get_champions_file_name())
+    write_csv(champions, champions_csv, 'w', champions_fieldnames)
+    get_storage().upload(champions_csv, "{}/{}".format(CLOUD_STORAGE_DATA_DIR, get_champions_file_name()))
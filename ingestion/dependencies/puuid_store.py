@@ -0,0 +1,174 @@
+# puuid cache keyed by summonerId, stored as shards so that a run only transfers what changed
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+from dependencies.common import CLOUD_STORAGE_SIDE_INPUT_DIR, data_directory
+from dependencies.storage import get_storage
+
+NB_SHARDS = 64
+
+# entries not refreshed for this long are evicted, in seconds
+PUUID_CACHE_TTL = 90 * 24 * 3600
+
+puuid_cache_dir = "puuid_cache"
+# the cache before the store: one JSON object that maps summoner names to puuids
+legacy_cache_file = "puuid_cache.json"
+
+
+def get_shard(summoner_id):
+    """
+    It returns the shard of a summonerId. The hash is stable between processes, unlike `hash`
+
+    :param summoner_id: the summonerId
+    :return: The shard number, between 0 and NB_SHARDS - 1
+    """
+    return int(hashlib.md5(summoner_id.encode('utf-8')).hexdigest()[:8], 16) % NB_SHARDS
+
+
+class PuuidStore:
+    """
+    A puuid cache keyed by the stable summonerId, so that renamed players still hit. Entries are
+    split into NB_SHARDS JSON files kept in a local directory and mirrored in the side input directory
+    of the storage. `load` only downloads the shards whose content differs from the local copy, and `save`
+    only uploads the shards that changed during the run.
+
+    The legacy cache, keyed by summoner name, is migrated once: the first run of the store reads it,
+    `migrate` seeds the shards with the puuids of the summoners of the run, and `save` marks it as
+    migrated so that the following runs do not read it again.
+    """
+
+    def __init__(self, ttl=PUUID_CACHE_TTL):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.shards = [{} for _ in range(NB_SHARDS)]
+        self.dirty = set()
+        self.local_directory = os.path.join(data_directory, puuid_cache_dir)
+        self.gcs_directory = "{}/{}".format(CLOUD_STORAGE_SIDE_INPUT_DIR, puuid_cache_dir)
+        self.legacy_path = "{}/{}".format(CLOUD_STORAGE_SIDE_INPUT_DIR, legacy_cache_file)
+        self.migrated_path = "{}/legacy_migrated.json".format(self.gcs_directory)
+        # summoner name -> puuid of the legacy cache, while it is migrated
+        self.legacy_puuids = None
+        self.migration_saved = False
+
+    def get_paths(self, shard):
+        name = "shard_{:02d}.json".format(shard)
+        return os.path.join(self.local_directory, name), "{}/{}".format(self.gcs_directory, name)
+
+    def load(self):
+        """
+        It synchronizes the local shards with the storage, downloading only the shards that changed, then
+        reads them. Expired entries are dropped, and their shards will be uploaded by `save`
+        """
+        os.makedirs(self.local_directory, exist_ok=True)
+        # listing remembers the checksums, so unchanged shards are not downloaded
+        remote_files = get_storage().list(self.gcs_directory + "/")
+
+        nb_downloaded = 0
+        now = time.time()
+        for shard in range(NB_SHARDS):
+            local_path, gcs_path = self.get_paths(shard)
+
+            if gcs_path in remote_files and get_storage().download(gcs_path, local_path):
+                nb_downloaded += 1
+
+            if not os.path.exists(local_path):
+                continue
+
+            with open(local_path, "r", encoding='utf-8') as f:
+                entries = json.load(f)
+
+            fresh_entries = {summoner_id: entry for summoner_id, entry in entries.items()
+                             if now - entry['updated'] <= self.ttl}
+            if len(fresh_entries) != len(entries):
+                self.dirty.add(shard)
+            self.shards[shard] = fresh_entries
+
+        print("PUUID cache: {} entries, {} shards downloaded".format(len(self), nb_downloaded))
+
+        if self.migrated_path not in remote_files and get_storage().exists(self.legacy_path):
+            self.legacy_puuids = json.loads(get_storage().read(self.legacy_path))
+            print("PUUID cache: {} names of {} to migrate".format(len(self.legacy_puuids), legacy_cache_file))
+
+    def migrate(self, summoners):
+        """
+        It seeds the store with the puuids of the legacy cache, for the summoners of a summoners file:
+        the file gives the summonerId of each summoner name. Nothing is done once the legacy cache is
+        migrated
+
+        :param summoners: the rows of a summoners file, with the keys summonerId and summonerName
+        :return: The number of entries added
+        """
+        if self.legacy_puuids is None:
+            return 0
+
+        nb_added = 0
+        for item in summoners:
+            puuid = self.legacy_puuids.get(item['summonerName'])
+            if puuid and self.get(item['summonerId']) is None:
+                self.put(item['summonerId'], item['summonerName'], puuid)
+                nb_added += 1
+
+        print("PUUID cache: {} entries migrated from {}".format(nb_added, legacy_cache_file))
+        return nb_added
+
+    def __len__(self):
+        return sum(len(entries) for entries in self.shards)
+
+    def get(self, summoner_id):
+        """
+        It returns the cached puuid of a summoner, or None. Entries older than half the TTL are
+        refreshed on hit, so summoners still in the ladder are not evicted, while a shard is uploaded
+        again at most every TTL / 2 because of hits
+
+        :param summoner_id: the summonerId
+        """
+        shard = get_shard(summoner_id)
+        entry = self.shards[shard].get(summoner_id)
+        if entry is None:
+            return None
+
+        if time.time() - entry['updated'] > self.ttl / 2:
+            with self.lock:
+                entry['updated'] = time.time()
+                self.dirty.add(shard)
+
+        return entry['puuid']
+
+    def put(self, summoner_id, summoner_name, puuid):
+        """
+        It adds or refreshes the puuid of a summoner
+
+        :param summoner_id: the summonerId
+        :param summoner_name: the current name of the summoner, kept for debugging
+        :param puuid: the puuid
+        """
+        shard = get_shard(summoner_id)
+        with self.lock:
+            self.shards[shard][summoner_id] = {'puuid': puuid, 'summonerName': summoner_name, 'updated': time.time()}
+            self.dirty.add(shard)
+
+    def save(self):
+        """
+        It writes the shards changed since `load` and uploads them to the storage
+        """
+        with self.lock:
+            dirty = sorted(self.dirty)
+            self.dirty = set()
+
+            for shard in dirty:
+                local_path, gcs_path = self.get_paths(shard)
+                # ensure_ascii = False because some summoners name have accent
+                with open(local_path, "w", encoding='utf-8') as f:
+                    json.dump(self.shards[shard], f, ensure_ascii=False, sort_keys=True)
+                get_storage().upload(local_path, gcs_path, content_type='application/json')
+
+        print("PUUID cache: {} shards uploaded".format(len(dirty)))
+
+        # the runs that loaded the legacy cache keep migrating it, the next ones do not read it
+        if self.legacy_puuids is not None and not self.migration_saved:
+            get_storage().write(self.migrated_path, json.dumps({'migrated': time.time()}), content_type='application/json')
+            self.migration_saved = True
@@ -0,0 +1,41 @@
+# regions crawled by the pipeline: a platform (summoners, leagues) and its regional routing (matches)
+
+from dependencies.common import HOST, HOST_EU
+
+
+def get_region(region=None):
+    """
+    It returns the hosts and the name of a region. A region is given as a "platform:routing" pair,
+    e.g. "euw1:europe" or "na1:americas". None is the region configured by HOST and HOST_EU in common
+
+    :param region: a "platform:routing" pair, or None
+    :return: A dictionary with the keys 'platform', 'platform_host' and 'regional_host'
+    """
+    if region is None:
+        return {'platform': HOST.split('.')[0], 'platform_host': HOST, 'regional_host': HOST_EU}
+
+    platform, routing = region.split(':')
+    return {
+        'platform': platform,
+        'platform_host': "{}.api.riotgames.com".format(platform),
+        'regional_host': "{}.api.riotgames.com".format(routing),
+    }
+
+
+def get_file_label(date_label, region=None, shard=None):
+    """
+    It returns the label used in the file names of a day. Files of an explicit region are prefixed by
+    its platform (summoners_euw1_20220601.csv), the configured region keeps the plain date label.
+    Files of a shard are suffixed by it (matches_id_20220601_DIAMOND.csv)
+
+    :param date_label: the date label, e.g. 20220601
+    :param region: a "platform:routing" pair, or None
+    :param shard: the tier of a shard, or None for the whole day
+    :return: The file label
+    """
+    label = date_label
+    if region is not None:
+        label = "{}_{}".format(get_region(region)['platform'], label)
+    if shard is not None:
+        label = "{}_{}".format(label, shard)
+    return label
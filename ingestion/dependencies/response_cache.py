@@ -0,0 +1,142 @@
+# on-disk cache of raw API responses, so that re-runs cost disk I/O instead of API quota
+
+import hashlib
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+
+HEADER = struct.Struct("<d")
+
+
+class ResponseCache:
+    """
+    A size-bounded cache of response bodies on disk. Entries are zlib-compressed files named after
+    the hash of the request, grouped by API method. Each entry stores the time it was written, so
+    the TTL can be chosen per method when reading. When the cache grows over `max_bytes`, the least
+    recently used entries are removed.
+
+    Several processes can share the directory (the shard tasks of the DAG, the days of a parallel
+    backfill). The size is counted per process: the files of the directory when the cache is created,
+    then the entries the process writes or reads. The files the other processes write in the meantime
+    are not counted, so together they can go over `max_bytes` until a process starts again.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        # path -> (size, last access), in the order of last access
+        self.entries = {}
+        self.total_bytes = 0
+        self.scan()
+
+    def scan(self):
+        os.makedirs(self.directory, exist_ok=True)
+        found = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                # files being written by another process
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                found.append((stat.st_mtime, path, stat.st_size))
+
+        for last_access, path, size in sorted(found):
+            self.entries[path] = (size, last_access)
+            self.total_bytes += size
+
+    def get_path(self, method, key):
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, method, digest[:2], digest + ".z")
+
+    def get(self, method, key, ttl=None):
+        """
+        It returns the cached body of a request, or None if it is not cached or older than `ttl`
+
+        :param method: the API method, e.g. match-v5.getMatch
+        :param key: the request key (host and endpoint)
+        :param ttl: the maximum age of the entry in seconds, None for no limit
+        :return: The response body as a string, or None
+        """
+        path = self.get_path(method, key)
+        with self.lock:
+            # an entry unknown to this process can have been written by another one since the scan
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            except OSError:
+                self.forget(path)
+                return None
+
+            if path not in self.entries:
+                self.entries[path] = (len(data), time.time())
+                self.total_bytes += len(data)
+
+            (stored_at,) = HEADER.unpack_from(data)
+            if ttl is not None and time.time() - stored_at > ttl:
+                self.remove(path)
+                return None
+
+            # move the entry to the end: it becomes the most recently used
+            size, _ = self.entries.pop(path)
+            now = time.time()
+            self.entries[path] = (size, now)
+            os.utime(path, (now, now))
+
+        return zlib.decompress(data[HEADER.size:]).decode('utf-8')
+
+    def put(self, method, key, body):
+        """
+        It stores the body of a response, then evicts the least recently used entries if the cache
+        is over budget. A failed write is printed and ignored: the response is used anyway, it is only
+        not cached
+
+        :param method: the API method, e.g. match-v5.getMatch
+        :param key: the request key (host and endpoint)
+        :param body: the response body as a string
+        """
+        path = self.get_path(method, key)
+        data = HEADER.pack(time.time()) + zlib.compress(body.encode('utf-8'))
+
+        with self.lock:
+            # the temporary file is unique to the process and thread, processes can share the directory
+            tmp_path = "{}.{}.{}.tmp".format(path, os.getpid(), threading.get_ident())
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(tmp_path, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except OSError:
+                print("Response not cached:", sys.exc_info()[0], sys.exc_info()[1])
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                return
+
+            self.forget(path)
+            self.entries[path] = (len(data), time.time())
+            self.total_bytes += len(data)
+            self.evict()
+
+    def forget(self, path):
+        if path in self.entries:
+            size, _ = self.entries.pop(path)
+            self.total_bytes -= size
+
+    def remove(self, path):
+        self.forget(path)
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def evict(self):
+        while self.total_bytes > self.max_bytes and self.entries:
+            oldest = next(iter(self.entries))
+            self.remove(oldest)
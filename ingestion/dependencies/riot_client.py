@@ -0,0 +1,254 @@
+# shared Riot API client: pooled keep-alive session + proactive rate limiting
+
+import json
+import threading
+import time
+
+from dependencies.common import X_RIOT_TOKEN, RESPONSE_CACHE_DIR, RESPONSE_CACHE_MAX_BYTES
+from dependencies.response_cache import ResponseCache
+
+# limits of a development key, used until the first response tells us the real ones
+DEFAULT_APP_RATE_LIMIT = "20:1,100:120"
+# method limits are not known before the first response of a method: the requests sent at the same
+# time before it are held to this, well under the method limits of the endpoints used
+DEFAULT_METHOD_RATE_LIMIT = "20:10"
+
+# keep this fraction of every window as head room so we stay just under the limits
+RATE_LIMIT_MARGIN = 0.9
+
+# the window of the server starts when it receives the first request, a little after it was sent: our
+# count is reset this long after the end of our window, so that it is never reset before the server's
+WINDOW_PADDING = 0.25
+
+POOL_SIZE = 16
+
+# how long a response of each method stays valid in the response cache, in seconds
+# (None: forever, methods not listed are not cached)
+CACHE_TTLS = {
+    "match-v5.getMatch": None,
+    "match-v5.getMatchIdsByPUUID": 6 * 3600,
+    "summoner-v4.getBySummonerName": 24 * 3600,
+    "league-v4.getLeagueEntries": 3600,
+}
+
+
+def parse_rate_limit_header(value):
+    """
+    It parses a Riot rate limit header like "20:1,100:120" into a list of (count, window) tuples
+
+    :param value: the header value, e.g. "20:1,100:120"
+    :return: A list of (count, window_in_seconds) tuples
+    """
+    if not value:
+        return []
+
+    result = []
+    for item in value.split(','):
+        count, window = item.split(':')
+        result.append((int(count), int(window)))
+    return result
+
+
+class FixedWindow:
+    """
+    One rate limit of Riot: at most `limit` requests in a window of `window` seconds that starts with
+    its first request, the count starting again from 0 once the window is over. We send at most
+    `limit * RATE_LIMIT_MARGIN` requests in each window
+    """
+
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+        self.capacity = max(1, int(limit * RATE_LIMIT_MARGIN))
+        self.count = 0
+        self.start = None
+
+    def reset(self, now):
+        if self.start is not None and now >= self.start + self.window + WINDOW_PADDING:
+            self.count = 0
+            self.start = None
+
+    def wait_time(self, now):
+        if self.count < self.capacity:
+            return 0.0
+        return self.start + self.window + WINDOW_PADDING - now
+
+    def take(self, now):
+        if self.start is None:
+            self.start = now
+        self.count += 1
+
+    def sync(self, used, now):
+        # the server count includes requests we did not see (other processes using the same key)
+        if used > self.count:
+            if self.start is None:
+                self.start = now
+            self.count = used
+
+
+class RateLimiter:
+    """
+    A set of fixed windows that must all have room for a request before it goes out
+    """
+
+    def __init__(self, limits=None):
+        self.lock = threading.Lock()
+        self.windows = {}
+        self.blocked_until = 0.0
+        if limits:
+            self.update_limits(limits)
+
+    def update_limits(self, limits):
+        """
+        It replaces the windows whose limit changed, keeping the count of the requests already sent in
+        their current window
+
+        :param limits: a list of (count, window) tuples
+        """
+        with self.lock:
+            windows = {}
+            for limit, window in limits:
+                fixed_window = self.windows.get(window)
+                if fixed_window is None or fixed_window.limit != limit:
+                    new_window = FixedWindow(limit, window)
+                    if fixed_window is not None:
+                        new_window.count, new_window.start = fixed_window.count, fixed_window.start
+                    fixed_window = new_window
+                windows[window] = fixed_window
+            self.windows = windows
+
+    def update_counts(self, counts):
+        """
+        It aligns the windows with the request counts reported by the server
+
+        :param counts: a list of (count, window) tuples
+        """
+        with self.lock:
+            now = time.monotonic()
+            for used, window in counts:
+                fixed_window = self.windows.get(window)
+                if fixed_window:
+                    fixed_window.reset(now)
+                    fixed_window.sync(used, now)
+
+    def block(self, seconds):
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def acquire(self):
+        """
+        It blocks until every window has room for a request, then counts it in each
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                wait = self.blocked_until - now
+                if wait <= 0:
+                    for fixed_window in self.windows.values():
+                        fixed_window.reset(now)
+                    wait = max([fixed_window.wait_time(now) for fixed_window in self.windows.values()], default=0.0)
+                    if wait <= 0:
+                        for fixed_window in self.windows.values():
+                            fixed_window.take(now)
+                        return
+            time.sleep(wait)
+
+
+class RiotClient:
+    """
+    A thread-safe client for the Riot API. All stages share one instance (see `get_client`) so that
+    connections are reused and every request is paced by the same app and method limiters.
+    App limits apply per host, method limits per (host, method).
+    """
+
+    def __init__(self, token=X_RIOT_TOKEN, pool_size=POOL_SIZE, cache=None):
+        self.token = token
+        self.cache = cache
+        # requests is imported here so that importing the stages stays cheap
+        import requests
+        from requests.adapters import HTTPAdapter
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"X-Riot-Token": token})
+        self.lock = threading.Lock()
+        self.app_limiters = {}
+        self.method_limiters = {}
+
+    def get_limiters(self, host, method):
+        with self.lock:
+            if host not in self.app_limiters:
+                self.app_limiters[host] = RateLimiter(parse_rate_limit_header(DEFAULT_APP_RATE_LIMIT))
+            if (host, method) not in self.method_limiters:
+                self.method_limiters[(host, method)] = RateLimiter(parse_rate_limit_header(DEFAULT_METHOD_RATE_LIMIT))
+            return self.app_limiters[host], self.method_limiters[(host, method)]
+
+    def update_limiters(self, app_limiter, method_limiter, response_headers):
+        if 'X-App-Rate-Limit' in response_headers:
+            app_limiter.update_limits(parse_rate_limit_header(response_headers['X-App-Rate-Limit']))
+        if 'X-App-Rate-Limit-Count' in response_headers:
+            app_limiter.update_counts(parse_rate_limit_header(response_headers['X-App-Rate-Limit-Count']))
+        if 'X-Method-Rate-Limit' in response_headers:
+            method_limiter.update_limits(parse_rate_limit_header(response_headers['X-Method-Rate-Limit']))
+        if 'X-Method-Rate-Limit-Count' in response_headers:
+            method_limiter.update_counts(parse_rate_limit_header(response_headers['X-Method-Rate-Limit-Count']))
+
+    def get(self, host, endpoint, method):
+        """
+        It sends a GET request to the Riot API once the rate limiters allow it, and returns the
+        decoded JSON body. If the API still answers with a Retry-After, it waits and tries again.
+        Methods listed in CACHE_TTLS are served from the response cache when possible.
+
+        :param host: the API host, e.g. euw1.api.riotgames.com
+        :param endpoint: the path and query string of the request
+        :param method: the name of the API method, used to key the method rate limiter
+        :return: The decoded JSON body of the response
+        """
+        url = "https://{HOST}{endpoint}".format(HOST=host, endpoint=endpoint)
+
+        use_cache = self.cache is not None and method in CACHE_TTLS
+        if use_cache:
+            data_text = self.cache.get(method, url, ttl=CACHE_TTLS[method])
+            if data_text is not None:
+                return json.loads(data_text)
+
+        app_limiter, method_limiter = self.get_limiters(host, method)
+
+        while True:
+            method_limiter.acquire()
+            app_limiter.acquire()
+
+            response = self.session.get(url=url)
+            response_headers = response.headers
+            self.update_limiters(app_limiter, method_limiter, response_headers)
+
+            if 'Retry-After' in response_headers:
+                time_sleep = int(response_headers['Retry-After'])
+                print("Hit rate limit. Sleep {} seconds".format(time_sleep))
+                # a 429 without X-Rate-Limit-Type "method" is an app (or service) limit
+                if response_headers.get('X-Rate-Limit-Type') == 'method':
+                    method_limiter.block(time_sleep)
+                else:
+                    app_limiter.block(time_sleep)
+                continue
+
+            # only successful responses are cached, errors (404, 5xx) are asked again next time
+            if use_cache and response.status_code == 200:
+                self.cache.put(method, url, response.text)
+
+            return json.loads(response.text)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    It returns the process-wide Riot API client, creating it on first use
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = RiotClient(cache=ResponseCache(RESPONSE_CACHE_DIR, RESPONSE_CACHE_MAX_BYTES))
+        return _client
@@ -0,0 +1,159 @@
+# streaming writers: rows are appended to the output files as they are produced
+
+import csv
+
+# number of buffered rows before they are written to the file
+FLUSH_EVERY = 1000
+
+
+class CsvSink:
+    """
+    A CSV writer that buffers rows and appends them to the file every `flush_every` rows, so that
+    memory does not depend on the number of rows written. It writes the same output as `write_csv`.
+    """
+
+    def __init__(self, path, keys, mode='w', flush_every=FLUSH_EVERY):
+        """
+        :param path: the path of the CSV file
+        :param keys: the field names, in column order
+        :param mode: 'w' to start a new file with a header, 'a' to append to an existing file
+        :param flush_every: the number of rows kept in memory before writing, defaults to FLUSH_EVERY
+        """
+        self.path = path
+        self.flush_every = flush_every
+        self.buffer = []
+        self.nb_rows = 0
+        self.output_file = open(path, mode, newline='', encoding='utf-8')
+        self.dict_writer = csv.DictWriter(self.output_file, keys)
+        if mode == 'w':
+            self.dict_writer.writeheader()
+
+    def write(self, row):
+        self.buffer.append(row)
+        if len(self.buffer) >= self.flush_every:
+            self.flush()
+
+    def write_rows(self, rows):
+        for row in rows:
+            self.write(row)
+
+    def flush(self):
+        """
+        It writes the buffered rows and flushes the file, so its content is complete on disk
+        """
+        self.dict_writer.writerows(self.buffer)
+        self.nb_rows += len(self.buffer)
+        self.buffer = []
+        self.output_file.flush()
+
+    def close(self):
+        if not self.output_file.closed:
+            self.flush()
+            self.output_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class ColumnBuffer:
+    """
+    Rows stored by column instead of a dictionary per row: one list per column, which the transform
+    extends with the values of a whole match at a time (see get_match_data.filter_attributes_match_into).
+    None is a missing value. The lists are emptied in place, so references to them stay valid.
+    """
+
+    def __init__(self, columns):
+        """
+        :param columns: the (name, type) pairs of the columns, in order. The type ('int', 'bool' or
+        'str') is that of the values of the column
+        """
+        self.names = [name for name, _ in columns]
+        self.types = [column_type for _, column_type in columns]
+        self.columns = [[] for _ in columns]
+
+    def __len__(self):
+        return len(self.columns[0])
+
+    def append(self, values):
+        """
+        It appends a row
+
+        :param values: the values of the row, in the order of the columns
+        """
+        for column, value in zip(self.columns, values):
+            column.append(value)
+
+    def truncate(self, size):
+        """
+        It removes the rows after the first `size`, e.g. those of a match that failed to transform
+
+        :param size: the number of rows kept
+        """
+        for column in self.columns:
+            del column[size:]
+
+    def clear(self):
+        self.truncate(0)
+
+
+class ColumnarCsvSink:
+    """
+    A CSV writer whose rows are kept in a ColumnBuffer until `flush_every` rows, then written from the
+    columns without a dictionary per row. It writes the same output as CsvSink for the same values.
+    """
+
+    def __init__(self, path, columns, mode='w', flush_every=FLUSH_EVERY):
+        """
+        :param path: the path of the CSV file
+        :param columns: the (name, type) pairs of the columns, see ColumnBuffer
+        :param mode: 'w' to start a new file with a header, 'a' to append to an existing file
+        :param flush_every: the number of rows kept in memory before writing, defaults to FLUSH_EVERY
+        """
+        self.path = path
+        self.flush_every = flush_every
+        self.buffer = ColumnBuffer(columns)
+        self.columns = self.buffer.columns
+        self.nb_rows = 0
+        self.output_file = open(path, mode, newline='', encoding='utf-8')
+        self.writer = csv.writer(self.output_file)
+        if mode == 'w':
+            self.writer.writerow(self.buffer.names)
+
+    def __len__(self):
+        return len(self.buffer)
+
+    def append(self, values):
+        self.buffer.append(values)
+        self.flush_if_full()
+
+    def truncate(self, size):
+        self.buffer.truncate(size)
+
+    def flush_if_full(self):
+        # the rows are written once there are flush_every of them
+        if len(self.buffer) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        """
+        It writes the buffered rows and flushes the file, so its content is complete on disk
+        """
+        # csv writes None as an empty value and the booleans as True and False, like DictWriter
+        self.writer.writerows(zip(*self.buffer.columns))
+        self.nb_rows += len(self.buffer)
+        self.buffer.clear()
+        self.output_file.flush()
+
+    def close(self):
+        if not self.output_file.closed:
+            self.flush()
+            self.output_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
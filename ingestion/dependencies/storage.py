@@ -0,0 +1,249 @@
+# storage of the files exchanged between the stages: GCS, or a local directory
+
+import base64
+import hashlib
+import os
+import shutil
+import threading
+
+from dependencies.common import STORAGE_BACKEND, LOCAL_STORAGE_ROOT, CLOUD_STORAGE_BUCKET, get_bucket
+
+
+def get_md5(data):
+    # same encoding as the md5_hash of a GCS blob
+    return base64.b64encode(hashlib.md5(data).digest()).decode('ascii')
+
+
+def get_file_md5(path):
+    """
+    It returns the md5 of a local file, or None if the file does not exist
+
+    :param path: the path of the file
+    :return: The base64 encoded md5, as GCS reports it
+    """
+    if not os.path.exists(path):
+        return None
+
+    md5 = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            md5.update(chunk)
+    return base64.b64encode(md5.digest()).decode('ascii')
+
+
+class Storage:
+    """
+    The operations the stages use to exchange files. Paths are relative to the storage, e.g.
+    "temp/summoners_20220601.csv".
+
+    The storage remembers the checksum of the files it transferred or listed, so a download is skipped
+    when the local copy already has the same content (the stage that uploaded it ran in the same
+    process, or a previous run left it there), and an upload is skipped when the file did not change.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checksums = {}
+
+    def remember(self, path, md5):
+        with self.lock:
+            if md5 is None:
+                self.checksums.pop(path, None)
+            else:
+                self.checksums[path] = md5
+
+    def get_remote_md5(self, path):
+        with self.lock:
+            md5 = self.checksums.get(path)
+        if md5 is None:
+            md5 = self.fetch_md5(path)
+            self.remember(path, md5)
+        return md5
+
+    def download(self, path, local_path):
+        """
+        It copies a file of the storage to a local path, unless the local file has the same content
+
+        :param path: the path in the storage
+        :param local_path: the local path
+        :return: True if the file was transferred, False if the local copy was up to date
+        """
+        local_md5 = get_file_md5(local_path)
+        if local_md5 is not None and local_md5 == self.get_remote_md5(path):
+            return False
+
+        self.download_file(path, local_path)
+        self.remember(path, get_file_md5(local_path))
+        return True
+
+    def upload(self, local_path, path, content_type=None):
+        """
+        It copies a local file to the storage, unless the storage already has the same content
+
+        :param local_path: the local path
+        :param path: the path in the storage
+        :param content_type: the content type of the file, used by GCS
+        :return: True if the file was transferred, False if the storage was up to date
+        """
+        local_md5 = get_file_md5(local_path)
+        if local_md5 is None:
+            raise FileNotFoundError("{} does not exist, it cannot be uploaded to {}".format(local_path, path))
+        with self.lock:
+            known_md5 = self.checksums.get(path)
+        if known_md5 == local_md5:
+            return False
+
+        self.upload_file(local_path, path, content_type)
+        self.remember(path, local_md5)
+        return True
+
+    def read(self, path):
+        raise NotImplementedError
+
+    def write(self, path, data, content_type=None):
+        raise NotImplementedError
+
+    def exists(self, path):
+        raise NotImplementedError
+
+    def list(self, prefix):
+        """
+        It lists the files under a prefix, and remembers their checksums
+
+        :param prefix: the prefix of the paths, e.g. "side_input/puuid_cache/"
+        :return: A dictionary that maps each path to its md5
+        """
+        files = self.list_files(prefix)
+        with self.lock:
+            self.checksums.update({path: md5 for path, md5 in files.items() if md5 is not None})
+        return files
+
+    def delete(self, path):
+        raise NotImplementedError
+
+
+class GcsStorage(Storage):
+    """
+    The files are blobs of the bucket configured in common
+    """
+
+    def get_uri(self, path):
+        return "gs://{}/{}".format(CLOUD_STORAGE_BUCKET, path)
+
+    def fetch_md5(self, path):
+        blob = get_bucket().get_blob(path)
+        return blob.md5_hash if blob is not None else None
+
+    def download_file(self, path, local_path):
+        get_bucket().blob(path).download_to_filename(local_path)
+
+    def upload_file(self, local_path, path, content_type):
+        get_bucket().blob(path).upload_from_filename(local_path, content_type=content_type)
+
+    def read(self, path):
+        return get_bucket().blob(path).download_as_string(client=None)
+
+    def write(self, path, data, content_type=None):
+        get_bucket().blob(path).upload_from_string(data=data, content_type=content_type)
+        self.remember(path, None)
+
+    def exists(self, path):
+        return get_bucket().blob(path).exists()
+
+    def list_files(self, prefix):
+        return {blob.name: blob.md5_hash for blob in get_bucket().list_blobs(prefix=prefix)}
+
+    def delete(self, path):
+        get_bucket().blob(path).delete()
+        self.remember(path, None)
+
+
+class LocalStorage(Storage):
+    """
+    The files are kept under a local directory, with the same layout as in the bucket. It is used to
+    run the pipeline on a single host, or offline
+    """
+
+    def __init__(self, root=LOCAL_STORAGE_ROOT):
+        super().__init__()
+        self.root = root
+
+    def get_path(self, path):
+        return os.path.join(self.root, *path.split('/'))
+
+    def copy(self, source, destination):
+        # write then rename, so that a reader never sees a partial file. The temporary file is unique to
+        # the process and thread: parallel days can write the same file, e.g. the match index
+        os.makedirs(os.path.dirname(os.path.abspath(destination)), exist_ok=True)
+        tmp_path = "{}.{}.{}.tmp".format(destination, os.getpid(), threading.get_ident())
+        try:
+            shutil.copyfile(source, tmp_path)
+            os.replace(tmp_path, destination)
+        except:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def fetch_md5(self, path):
+        return get_file_md5(self.get_path(path))
+
+    def download_file(self, path, local_path):
+        if not os.path.exists(self.get_path(path)):
+            raise FileNotFoundError("{} is not in the local storage {}".format(path, self.root))
+        self.copy(self.get_path(path), local_path)
+
+    def upload_file(self, local_path, path, content_type):
+        self.copy(local_path, self.get_path(path))
+
+    def read(self, path):
+        with open(self.get_path(path), "rb") as f:
+            return f.read()
+
+    def write(self, path, data, content_type=None):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        local_path = self.get_path(path)
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        with open(local_path, "wb") as f:
+            f.write(data)
+        self.remember(path, get_md5(data))
+
+    def exists(self, path):
+        return os.path.exists(self.get_path(path))
+
+    def list_files(self, prefix):
+        files = {}
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.relpath(os.path.join(directory, name), self.root).replace(os.sep, '/')
+                if path.startswith(prefix):
+                    files[path] = get_file_md5(os.path.join(directory, name))
+        return files
+
+    def delete(self, path):
+        os.remove(self.get_path(path))
+        self.remember(path, None)
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage():
+    """
+    It returns the storage selected by STORAGE_BACKEND in common, created on the first call
+
+    :return: A GcsStorage if STORAGE_BACKEND is "gcs", a LocalStorage if it is "local"
+    """
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            if STORAGE_BACKEND == "gcs":
+                _storage = GcsStorage()
+            elif STORAGE_BACKEND == "local":
+                _storage = LocalStorage()
+            else:
+                raise ValueError("Unknown storage backend {}".format(STORAGE_BACKEND))
+        return _storage
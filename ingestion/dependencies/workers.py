@@ -0,0 +1,31 @@
+# helpers to run network-bound work on a bounded pool of threads
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+def bounded_map(func, items, concurrency=1):
+    """
+    It applies `func` to every item with at most `concurrency` calls in flight, and yields the
+    results in the order of `items`. At most twice `concurrency` calls are queued at any time (so a
+    slow call at the head does not leave the workers idle), which keeps memory bounded on long inputs.
+
+    :param func: the function to apply to each item
+    :param items: an iterable of items
+    :param concurrency: the maximum number of calls running at the same time, defaults to 1
+    :return: A generator of results, in input order
+    """
+    if concurrency <= 1:
+        for item in items:
+            yield func(item)
+        return
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        in_flight = deque()
+        for item in items:
+            in_flight.append(executor.submit(func, item))
+            if len(in_flight) >= 2 * concurrency:
+                yield in_flight.popleft().result()
+
+        while in_flight:
+            yield in_flight.popleft().result()
@@ -1,12 +1,17 @@
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 import time
 import argparse
+import sys
 
 from dependencies.prepare import prepare
 from dependencies.get_summoners import get_summoners
 from dependencies.get_summoners_puuid import get_summoners_puuid
 from dependencies.get_matches_id import get_matches_id
 from dependencies.get_match_data import get_match_data
+from dependencies.load_match_data import load_match_data
+from dependencies.match_index import load_match_index
+from dependencies.puuid_store import PuuidStore
 
 
 def parse_string(str):
@@ -22,12 +27,16 @@ def parse_string(str):
 
     return datetime(year, month, day)
 
-def run_pipeline(date_arg):
+def run_pipeline(date_arg, concurrency=1, output_format='csv', regions=None):
     """
     `run_pipeline` is a function that takes a date as an argument and runs the pipeline for that date
     
     :param date_arg: The date you want to get data for. If you don't specify a date, it will get data
     for the previous day
+    :param concurrency: the number of API requests kept in flight by the fetching stages
+    :param output_format: 'csv' or 'parquet', the format of the matches and champs data
+    :param regions: the "platform:routing" pairs of the regions to crawl concurrently, None for the
+    region configured in common
     """
 
     if date_arg:
@@ -35,6 +44,12 @@ def run_pipeline(date_arg):
     else:
         date = datetime.today() - timedelta(days=1)
 
+    if regions:
+        print("Start get data for {} in {}".format(date, ", ".join(regions)))
+        run_parallel([date], regions, concurrency=concurrency, output_format=output_format,
+                     parallel_runs=len(regions))
+        return
+
     print("Start get data for {}".format(date))
     start_all = time.time()
 
@@ -42,11 +57,11 @@ def run_pipeline(date_arg):
     end_prepare = time.time()
     print("Finish prepare")
     
-    get_summoners(date)
+    get_summoners(date, concurrency=concurrency)
     end_get_summoners = time.time()
     print("Finish get summoners")
 
-    get_summoners_puuid(date)
+    get_summoners_puuid(date, concurrency=concurrency)
     end_get_puuid = time.time()
     print("Finish get summoners puuid")
     
@@ -54,7 +69,11 @@ def run_pipeline(date_arg):
     end_get_matches_id = time.time()
     print("Finish get matches id")
 
-    get_match_data(date)
+    get_match_data(date, concurrency=concurrency, output_format=output_format)
+    end_get_match_data = time.time()
+    print("Finish get match data")
+
+    load_match_data(date, output_format=output_format)
     end_all = time.time()
     print("Finish all")
 
@@ -62,9 +81,100 @@ def run_pipeline(date_arg):
     print('Get summoners time:', end_get_summoners - end_prepare, 'seconds')
     print('Get puuid time:', end_get_puuid - end_get_summoners, 'seconds')
     print('Get match id time:', end_get_matches_id - end_get_puuid, 'seconds')
-    print('Get match data time:', end_all - end_get_matches_id, 'seconds')
+    print('Get match data time:', end_get_match_data - end_get_matches_id, 'seconds')
+    print('Load match data time:', end_all - end_get_match_data, 'seconds')
     print('Execution time:', end_all - start_all, 'seconds')
 
+def run_day(date, region, concurrency, output_format, match_index, puuid_store):
+    """
+    It runs the stages of one day and one region, with the match index and the puuid cache shared by
+    all the runs of the process
+    
+    :param date: the day to get data for
+    :param region: the "platform:routing" pair of the region, None for the configured one
+    :return: The execution time of the run, in seconds
+    """
+    start_day = time.time()
+    get_summoners(date, region=region, concurrency=concurrency)
+    get_summoners_puuid(date, concurrency=concurrency, region=region, puuid_store=puuid_store)
+    get_matches_id(date, match_index=match_index, region=region)
+    get_match_data(date, concurrency=concurrency, output_format=output_format, region=region)
+    return time.time() - start_day
+
+def run_parallel(dates, regions, concurrency=1, output_format='csv', parallel_runs=4):
+    """
+    It runs the pipeline for every (day, region) pair, several pairs at the same time. All the runs go
+    through the same Riot API client, which keeps one rate limiter per host: regions have independent
+    budgets, days of a region share theirs. `prepare` happens once, and a match listed on several
+    days is fetched once. Each day is loaded to BigQuery once, if the runs of all its regions
+    succeeded: the load replaces the partition of the day, a day with a failed region is left as it
+    was and can be run again
+    
+    :param dates: the days to get data for
+    :param regions: the "platform:routing" pairs of the regions, [None] for the configured one
+    :param concurrency: the number of API requests kept in flight by the fetching stages of each run
+    :param output_format: 'csv' or 'parquet', the format of the matches and champs data
+    :param parallel_runs: the number of (day, region) pairs processed at the same time
+    """
+    start_all = time.time()
+
+    prepare()
+    match_index = load_match_index()
+    puuid_store = PuuidStore()
+    puuid_store.load()
+    print("Finish prepare")
+
+    failed_runs = []
+    succeeded_regions = {date: [] for date in dates}
+    with ThreadPoolExecutor(max_workers=parallel_runs) as executor:
+        futures = {
+            (date, region): executor.submit(run_day, date, region, concurrency, output_format, match_index, puuid_store)
+            for date in dates
+            for region in regions
+        }
+        for (date, region), future in futures.items():
+            run_label = "{} {}".format(date.date(), region or "")
+            try:
+                print('{} time:'.format(run_label), future.result(), 'seconds')
+                succeeded_regions[date].append(region)
+            except:
+                print(run_label, sys.exc_info()[0], sys.exc_info()[1])
+                failed_runs.append(run_label)
+
+    for date in dates:
+        if len(succeeded_regions[date]) < len(regions):
+            failed_runs.append("{} load (not all the regions succeeded)".format(date.date()))
+            continue
+        try:
+            load_match_data(date, regions=regions, output_format=output_format, match_index=match_index)
+        except:
+            print("{} load".format(date.date()), sys.exc_info()[0], sys.exc_info()[1])
+            failed_runs.append("{} load".format(date.date()))
+
+    print('Execution time:', time.time() - start_all, 'seconds')
+    if failed_runs:
+        print('Failed runs:', ', '.join(failed_runs))
+
+def run_backfill(start_date_arg, end_date_arg, concurrency=1, output_format='csv', parallel_days=4, regions=None):
+    """
+    It runs the pipeline for every day between two dates (both included), several days at the same time
+    
+    :param start_date_arg: the first day, YYYYMMDD
+    :param end_date_arg: the last day, YYYYMMDD
+    :param concurrency: the number of API requests kept in flight by the fetching stages of each day
+    :param output_format: 'csv' or 'parquet', the format of the matches and champs data
+    :param parallel_days: the number of days processed at the same time (for each region)
+    :param regions: the "platform:routing" pairs of the regions to crawl, None for the configured one
+    """
+    start_date = parse_string(start_date_arg)
+    end_date = parse_string(end_date_arg)
+    dates = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+    regions = regions or [None]
+
+    print("Start backfill from {} to {} ({} days)".format(start_date, end_date, len(dates)))
+    run_parallel(dates, regions, concurrency=concurrency, output_format=output_format,
+                 parallel_runs=parallel_days * len(regions))
+
 def main():
     """
     It takes a date argument, and if it's not provided, it uses the current date and run the pipeline
@@ -72,11 +182,27 @@ def main():
 
     parser = argparse.ArgumentParser(description='Get LOL ranked games')
     parser.add_argument("--date", type=str, required=False)
+    parser.add_argument("--start-date", type=str, required=False, help="first day of a backfill, YYYYMMDD")
+    parser.add_argument("--end-date", type=str, required=False, help="last day of a backfill, YYYYMMDD")
+    parser.add_argument("--parallel-days", type=int, default=4, help="number of backfill days run at the same time")
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="number of API requests kept in flight, the rate limiter still applies")
+    parser.add_argument("--output-format", choices=["csv", "parquet"], default="csv",
+                        help="format of the matches and champs data uploaded to GCS and BigQuery")
+    parser.add_argument("--regions", type=str, required=False,
+                        help="comma separated platform:routing pairs crawled concurrently, e.g. euw1:europe,na1:americas")
 
     args = parser.parse_args()
     date_arg = args.date
+    regions = args.regions.split(',') if args.regions else None
 
-    run_pipeline(date_arg)
+    if args.start_date or args.end_date:
+        if not (args.start_date and args.end_date):
+            parser.error("--start-date and --end-date go together")
+        run_backfill(args.start_date, args.end_date, concurrency=args.concurrency,
+                     output_format=args.output_format, parallel_days=args.parallel_days, regions=regions)
+    else:
+        run_pipeline(date_arg, concurrency=args.concurrency, output_format=args.output_format, regions=regions)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -2,7 +2,7 @@ from datetime import datetime, timedelta
 from airflow import DAG
 from airflow.operators.python_operator import PythonOperator
 
-from dependencies import prepare, get_summoners, get_summoners_puuid, get_matches_id, get_match_data
+from dependencies import prepare, get_summoners, get_summoners_puuid, get_matches_id, get_match_data, merge_match_data, load_match_data
 
 
 dag = DAG('lol_de', description='Lol Ranked Games', 
@@ -12,7 +12,21 @@ dag = DAG('lol_de', description='Lol Ranked Games',
 prepare_operator = PythonOperator(task_id='prepare', python_callable=prepare.prepare, dag=dag)
 get_summoners_operator = PythonOperator(task_id='get_summoners', python_callable=get_summoners.get_summoners, dag=dag, provide_context=True)
 get_summoners_puuid_operator = PythonOperator(task_id='get_summoners_puuid', python_callable=get_summoners_puuid.get_summoners_puuid, dag=dag, provide_context=True)
-get_matches_id_operator = PythonOperator(task_id='get_matches_id', python_callable=get_matches_id.get_matches_id, dag=dag, provide_context=True)
-get_match_data_operator = PythonOperator(task_id='get_match_data', python_callable=get_match_data.get_match_data, dag=dag, provide_context=True)
+# the matches of all the tiers are listed together, so that a match played by summoners of several tiers
+# is fetched by one shard only
+get_matches_id_operator = PythonOperator(task_id='get_matches_id', python_callable=get_matches_id.get_matches_id, dag=dag, provide_context=True,
+                                         op_kwargs={'shards': get_summoners.tiers})
+merge_match_data_operator = PythonOperator(task_id='merge_match_data', python_callable=merge_match_data.merge_match_data, dag=dag, provide_context=True,
+                                           op_kwargs={'shards': get_summoners.tiers})
+load_match_data_operator = PythonOperator(task_id='load_match_data', python_callable=load_match_data.load_match_data, dag=dag, provide_context=True)
 
-prepare_operator >> get_summoners_operator >> get_summoners_puuid_operator >> get_matches_id_operator >> get_match_data_operator
+prepare_operator >> get_summoners_operator >> get_summoners_puuid_operator >> get_matches_id_operator
+
+# the matches of each tier are fetched by their own tasks, which run in parallel
+for tier in get_summoners.tiers:
+    get_match_data_operator = PythonOperator(task_id='get_match_data_{}'.format(tier.lower()), python_callable=get_match_data.get_match_data,
+                                             dag=dag, provide_context=True, op_kwargs={'shard': tier})
+
+    get_matches_id_operator >> get_match_data_operator >> merge_match_data_operator
+
+merge_match_data_operator >> load_match_data_operator